@@ -0,0 +1,113 @@
+"""asv benchmarks of measuring profiles.
+
+Run from the repository root, e.g.:
+
+    asv run --quick
+    asv continuous main HEAD
+"""
+import numpy as np
+from napari.layers import Image
+
+from napari_plot_profile._profile import profile
+
+
+class Profile:
+    """`profile()` along lines with several vertex counts and sample counts."""
+    params = ([100, 10000, 1000000], [2, 10, 100], ['truncate', 'linear', 'cubic'])
+    param_names = ['num_points', 'num_vertices', 'interpolation']
+
+    def setup(self, num_points, num_vertices, interpolation):
+        self.layer = Image(np.random.random((2048, 2048)))
+        self.line = np.random.uniform(0, 2047, (num_vertices, 2))
+        self.prefilter_cache = {}
+        # spline coefficients are computed once per image in the plot widget
+        profile(self.layer, self.line, 2, interpolation=interpolation, prefilter_cache=self.prefilter_cache)
+
+    def time_profile(self, num_points, num_vertices, interpolation):
+        profile(self.layer, self.line, num_points, interpolation=interpolation, prefilter_cache=self.prefilter_cache)
+
+
+class ProfileLinewidth:
+    """`profile()` averaging bands of several widths."""
+    params = [1, 5, 25]
+    param_names = ['linewidth']
+
+    def setup(self, linewidth):
+        self.layer = Image(np.random.random((2048, 2048)))
+        self.line = np.asarray([[10, 10], [2000, 1500], [100, 2000]])
+
+    def time_profile(self, linewidth):
+        profile(self.layer, self.line, 10000, linewidth=linewidth)
+
+
+def _legacy_profile(layer, line, num_points : int = 256):
+    """Per-point implementation of `profile()` as shipped in napari-plot-profile 0.2.2."""
+    distance = 0
+    former_point = None
+    intermediate_distances = [0]
+    for point in line:
+        if former_point is not None:
+            distance = distance + np.linalg.norm(point - former_point)
+            intermediate_distances.append(distance)
+        former_point = point
+    intermediate_distances.append(intermediate_distances[-1])
+
+    step = distance / (num_points - 1)
+
+    positions = []
+    distances = []
+
+    current_line = 0
+    for i in range(num_points):
+        distance = i * step
+        while current_line < len(intermediate_distances) - 1 and distance > intermediate_distances[current_line + 1]:
+            current_line += 1
+        start = line[min(current_line, len(line) - 1)] / layer.scale
+        end = line[min(current_line + 1, len(line) - 1)] / layer.scale
+
+        position_on_line = distance - intermediate_distances[current_line]
+        if current_line == len(intermediate_distances)-1:
+            relative_position = 0
+        else:
+            line_length = intermediate_distances[current_line + 1] - intermediate_distances[current_line]
+            relative_position = position_on_line / line_length
+        position = end * relative_position + start * (1.0 - relative_position)
+
+        position_clipped = np.maximum(position, np.zeros(position.shape))
+        position_clipped = np.minimum(position_clipped, layer.data.shape - np.ones(position.shape))
+        if np.array_equal(position, position_clipped):
+            position = position.astype(int)
+            positions.append(position)
+            distances.append(i * step)
+
+    data = layer.data
+    intensities = [data[tuple(position)] for position in positions]
+
+    return {
+        'positions': positions,
+        'distances': distances,
+        'intensities': intensities
+    }
+
+
+def _skip_legacy_profile(num_points):
+    if num_points > 100000:
+        raise NotImplementedError("the per-point implementation takes minutes for this many points")
+
+
+class ProfileLegacy:
+    """`profile()` compared with the per-point implementation of napari-plot-profile 0.2.2."""
+    params = [1000, 100000, 10000000]
+    param_names = ['num_points']
+
+    def setup(self, num_points):
+        self.layer = Image(np.random.random((1024, 1024)))
+        self.line = np.asarray([[10, 10], [1000, 300], [500, 1000], [20, 900]], dtype=float)
+
+    def time_profile(self, num_points):
+        profile(self.layer, self.line, num_points)
+
+    def time_legacy_profile(self, num_points):
+        _legacy_profile(self.layer, self.line, num_points)
+    # asv runs setup functions attached to a benchmark in addition to the one of its class
+    time_legacy_profile.setup = _skip_legacy_profile
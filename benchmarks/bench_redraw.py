@@ -0,0 +1,42 @@
+"""asv benchmarks of redrawing the profile plot, without showing a window.
+
+Run from the repository root, e.g.:
+
+    asv run --quick --bench Redraw
+"""
+import os
+
+import numpy as np
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+class Redraw:
+    """`PlotProfile.redraw()` with several image layers, measuring all profiles or reading them from the cache."""
+    params = ([1, 4, 16], [1000, 100000])
+    param_names = ['num_layers', 'num_points']
+
+    def setup(self, num_layers, num_points):
+        from napari.components import ViewerModel
+        from qtpy.QtWidgets import QApplication
+        from napari_plot_profile import PlotProfile
+
+        self.app = QApplication.instance() or QApplication([])
+        viewer = ViewerModel()
+        for i in range(num_layers):
+            viewer.add_image(np.random.random((1024, 1024)), name='image' + str(i))
+        viewer.add_shapes([[10, 10], [1000, 900]], shape_type='path')
+
+        self.plotter = PlotProfile(viewer)
+        self.plotter._sp_num_points.setValue(num_points)
+        self.plotter.redraw(force_redraw=True, background=False)
+
+    def teardown(self, num_layers, num_points):
+        self.plotter.close()
+
+    def time_redraw(self, num_layers, num_points):
+        self.plotter.profile_cache.clear()
+        self.plotter.redraw(force_redraw=True, background=False)
+
+    def time_redraw_cached(self, num_layers, num_points):
+        self.plotter.redraw(force_redraw=True, background=False)
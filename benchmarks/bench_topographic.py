@@ -0,0 +1,93 @@
+"""asv benchmarks of the topographical views.
+
+Run from the repository root, e.g.:
+
+    asv run --quick --bench Topographic
+"""
+import numpy as np
+
+from napari_plot_profile._functions import _topographic_image_positive, topographic_points, topographic_surface
+
+
+class Topographic:
+    """Topographic images, points and surfaces of images of several sizes and types with intensities up to 255."""
+    params = ([256, 1024], ['uint8', 'uint16', 'float32'])
+    param_names = ['size', 'dtype']
+
+    def setup(self, size, dtype):
+        self.image = np.random.randint(0, 256, (size, size)).astype(dtype)
+
+    def time_topographic_image_positive(self, size, dtype):
+        _topographic_image_positive(self.image, 1)
+
+    def peakmem_topographic_image_positive(self, size, dtype):
+        _topographic_image_positive(self.image, 1)
+
+    def time_topographic_points(self, size, dtype):
+        topographic_points(self.image)
+
+    def time_topographic_surface(self, size, dtype):
+        topographic_surface(self.image)
+
+    def time_topographic_surface_simplified(self, size, dtype):
+        topographic_surface(self.image, max_error=0)
+
+
+class TopographicLarge:
+    """Tiled and level-of-detail processing of a large image."""
+    timeout = 300
+
+    def setup(self):
+        self.image = np.random.randint(0, 4096, (4096, 4096)).astype('uint16')
+
+    def time_topographic_points_level_of_detail(self):
+        topographic_points(self.image, max_points=1000000)
+
+    def time_topographic_surface_tiled(self):
+        topographic_surface(self.image, step_size=2, tile_size=1024)
+
+
+def _legacy_topographic_image_positive(image, sample_factor):
+    """Implementation of `_topographic_image_positive()` as shipped in napari-plot-profile 0.2.2."""
+    max_range = np.ceil(image.max()).astype(int)
+    z_indices = image.ravel().astype(int)[::sample_factor]
+    y_indices = np.indices(image.shape)[0].ravel()[::sample_factor]
+    x_indices = np.indices(image.shape)[1].ravel()[::sample_factor]
+
+    filled_z_indices = np.concatenate([np.arange(z_indices[i]+1)
+                                       for i in range(len(z_indices))])
+    filled_y_indices = np.repeat(y_indices,  z_indices+1)
+    filled_x_indices = np.repeat(x_indices,  z_indices+1)
+
+    output_image = np.zeros((max_range+1,
+                             image.shape[0],
+                             image.shape[1])).astype(int)
+    output_image[filled_z_indices,
+                 filled_y_indices,
+                 filled_x_indices] = filled_z_indices
+
+    return output_image
+
+
+class TopographicLegacy:
+    """Topographic images compared with the implementation of napari-plot-profile 0.2.2, which needs tens of bytes
+    per filled voxel and is therefore only measured on small images."""
+    params = ([256, 512], [255, 4095])
+    param_names = ['size', 'max_intensity']
+
+    def setup(self, size, max_intensity):
+        if size * size * max_intensity > 10 ** 8:
+            raise NotImplementedError("too large for the former implementation")
+        self.image = np.random.randint(0, max_intensity + 1, (size, size))
+
+    def time_topographic_image_positive(self, size, max_intensity):
+        _topographic_image_positive(self.image, 1)
+
+    def peakmem_topographic_image_positive(self, size, max_intensity):
+        _topographic_image_positive(self.image, 1)
+
+    def time_legacy_topographic_image_positive(self, size, max_intensity):
+        _legacy_topographic_image_positive(self.image, 1)
+
+    def peakmem_legacy_topographic_image_positive(self, size, max_intensity):
+        _legacy_topographic_image_positive(self.image, 1)
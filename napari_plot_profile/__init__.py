@@ -1,9 +1,35 @@
-
 __version__ = "0.2.2"
 
+from napari_plugin_engine import napari_hook_implementation
+
+# Widgets and functions are imported when they are accessed for the first time, so that importing the plugin does not
+# load Qt, pyqtgraph or napari. Profiles and topographical views can be computed without Qt. They are deliberately not
+# listed by dir(), which the plugin engine uses to search for hook implementations.
+_lazy_attributes = {
+    'PlotProfile': '._dock_widget',
+    'topographical_view': '._dock_widget',
+    'TopographicalVisualization': '._dock_widget',
+    'profile': '._profile',
+    'profile_all': '._profile',
+    'kymograph': '._profile',
+    'export_profiles': '._profile',
+    'topographic_image': '._functions',
+    'topographic_points': '._functions',
+    'topographic_surface': '._functions',
+}
 
 
+def __getattr__(name):
+    if name in _lazy_attributes:
+        import importlib
+        value = getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
 
-from ._dock_widget import napari_experimental_provide_dock_widget, PlotProfile, topographical_view, TopographicalVisualization
-from ._functions import topographic_image, topographic_points, topographic_surface
 
+@napari_hook_implementation
+def napari_experimental_provide_dock_widget():
+    # you can return either a single widget, or a sequence of widgets
+    from ._dock_widget import PlotProfile, topographical_view
+    return [PlotProfile, topographical_view]
@@ -1,11 +1,14 @@
+import logging
+import threading
 import time
 import warnings
+import weakref
+from collections import OrderedDict
 from enum import Enum
 from functools import partial
 
 from qtpy.QtWidgets import QSpacerItem, QSizePolicy
-from napari_plugin_engine import napari_hook_implementation
-from qtpy.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QSpinBox, QCheckBox
+from qtpy.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QSpinBox, QCheckBox, QComboBox
 from qtpy.QtWidgets import QTableWidget, QTableWidgetItem, QWidget, QGridLayout, QPushButton, QFileDialog
 from qtpy.QtCore import Qt
 from magicgui.widgets import Table
@@ -13,7 +16,8 @@ from napari._qt.qthreading import thread_worker
 from qtpy.QtCore import QTimer
 
 from magicgui import magic_factory
-from ._functions import topographic_image, topographic_points, topographic_surface
+from ._functions import topographic_image, topographic_points, topographic_surface, _topographic_image, _update_layer
+from ._profile import profile, profile_all, kymograph, export_profiles, _INTERPOLATION_ORDERS
 from napari.types import ImageData, LayerDataTuple
 from typing import List
 
@@ -23,15 +27,50 @@ import numpy as np
 import napari
 from napari_tools_menu import register_dock_widget
 
+# timings of redraws are logged at DEBUG level
+_logger = logging.getLogger(__name__)
+
+# layer events which trigger a redraw of the plot
+_SHAPES_EVENTS = ('data', 'set_data', 'highlight')
+_IMAGE_EVENTS = ('data', 'scale', 'visible', 'colormap', 'name')
+
+
+def _call_on_destruction(weak_method, *_):
+    # connected to the destroyed signal of a widget: Qt does not call bound methods of destroyed widgets anymore, and
+    # the method is referenced weakly so that the connection does not keep its object alive
+    method = weak_method()
+    if method is not None:
+        method()
+
+
+def _stop_timer(timer):
+    try:
+        timer.stop()
+    except RuntimeError:
+        # the timer has been deleted already, e.g. when the application is torn down
+        pass
+
+
 @register_dock_widget(menu="Measurement > Plot profile")
 class PlotProfile(QWidget):
-    def __init__(self, napari_viewer):
+    def __init__(self, napari_viewer, cache_size : int = 256 * 1024 ** 2):
         super().__init__()
         self._viewer = napari_viewer
         napari_viewer.layers.selection.events.changed.connect(self._on_selection)
 
-        self._data = None
+        self._data = []
         self._former_line = None
+        self._generation = 0
+        self._worker = None
+        self._plot_items = {}
+        # durations in seconds of the steps of the last redraw
+        self.last_timings = {}
+
+        # cache of computed profiles; layer data versions count data changes per layer
+        self.profile_cache = ProfileCache(max_bytes=cache_size)
+        self._data_versions = {}
+        # spline coefficients of images, reused by cubic interpolation, within a memory budget of their own
+        self._prefilter_cache = _PrefilterCache(max_bytes=cache_size)
 
         graph_container = QWidget()
 
@@ -67,9 +106,39 @@ class PlotProfile(QWidget):
         num_points_container.layout().setSpacing(0)
         self.layout().addWidget(num_points_container)
 
+        linewidth_container = QWidget()
+        linewidth_container.setLayout(QHBoxLayout())
+
+        lbl = QLabel("Line width")
+        linewidth_container.layout().addWidget(lbl)
+        self._sp_linewidth = QSpinBox()
+        self._sp_linewidth.setMinimum(1)
+        self._sp_linewidth.setMaximum(1000)
+        self._sp_linewidth.setValue(1)
+        self._sp_linewidth.valueChanged.connect(self._on_image_changed)
+        linewidth_container.layout().addWidget(self._sp_linewidth)
+        linewidth_container.layout().setSpacing(0)
+        self.layout().addWidget(linewidth_container)
+
+        interpolation_container = QWidget()
+        interpolation_container.setLayout(QHBoxLayout())
+
+        lbl = QLabel("Interpolation")
+        interpolation_container.layout().addWidget(lbl)
+        self._cmb_interpolation = QComboBox()
+        self._cmb_interpolation.addItems(list(_INTERPOLATION_ORDERS))
+        self._cmb_interpolation.currentIndexChanged.connect(self._on_image_changed)
+        interpolation_container.layout().addWidget(self._cmb_interpolation)
+        interpolation_container.layout().setSpacing(0)
+        self.layout().addWidget(interpolation_container)
+
+        self._cb_full_resolution = QCheckBox("Full resolution (multiscale images)")
+        self._cb_full_resolution.setChecked(False)
+        self._cb_full_resolution.stateChanged.connect(self._on_selection)
+        self.layout().addWidget(self._cb_full_resolution)
 
         btn_refresh = QPushButton("Refresh")
-        btn_refresh.clicked.connect(self._on_selection)
+        btn_refresh.clicked.connect(self._on_refresh)
         self.layout().addWidget(btn_refresh)
 
         self._cb_live_update = QCheckBox("Live update")
@@ -80,32 +149,38 @@ class PlotProfile(QWidget):
         btn_list_values.clicked.connect(self._list_values)
         self.layout().addWidget(btn_list_values)
 
+        btn_export = QPushButton("Export...")
+        btn_export.setToolTip("Save the profiles to a CSV or Parquet file")
+        btn_export.clicked.connect(self._on_export)
+        self.layout().addWidget(btn_export)
+
+        btn_kymograph = QPushButton("Kymograph")
+        btn_kymograph.setToolTip("Measure the profile in every slice along the first non-displayed axis, e.g. time")
+        btn_kymograph.clicked.connect(self._add_kymographs)
+        self.layout().addWidget(btn_kymograph)
+
         verticalSpacer = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
         self.layout().addItem(verticalSpacer)
         # self.layout().setSpacing(0)
 
-        # we're using a thread worker because layer.mouse_drag_callbacks doesn't work
-        # as expected in napari 0.4.10.
-        # Todo: check later if the thread_worker can be replaced with a mouse/move/drag event
-        # https://napari.org/guides/stable/threading.html
-        #@thread_worker
-        #def loop_run():
-        #    while True:  # endless loop
-        #        time.sleep(0.5)
-        #        yield True
-
-        #worker = loop_run()
-
-        #def update_layer(whatever):
-        #    if self.cb_live_update.isChecked():
-        #        self.redraw()
-        #    if not self.isVisible():
-        #        worker.quit()
-
-        # Start the loop
-        #worker.yielded.connect(update_layer)
-        #worker.start()
-
+        # redraw when the line, the images or the displayed slice change. Events are coalesced to at most one
+        # redraw per display frame.
+        self._force_redraw = False
+        self._redraw_timer = QTimer()
+        self._redraw_timer.setSingleShot(True)
+        self._redraw_timer.setInterval(16)
+        self._redraw_timer.timeout.connect(self._on_redraw_timer)
+
+        napari_viewer.layers.events.inserted.connect(self._on_layer_inserted)
+        napari_viewer.layers.events.removed.connect(self._on_layer_removed)
+        napari_viewer.dims.events.current_step.connect(self._on_image_changed)
+        for layer in napari_viewer.layers:
+            self._connect_layer(layer)
+        # napari removes dock widgets without closing them
+        self._connected = True
+        self.destroyed.connect(partial(_call_on_destruction, weakref.WeakMethod(self._disconnect_viewer)))
+
+        # fallback: poll for changes in case the events above are not emitted, e.g. in older napari versions
         self._timer = QTimer()
         self._timer.setInterval(500)
 
@@ -116,30 +191,148 @@ class PlotProfile(QWidget):
             if not self.isVisible():
                 self._timer.stop()
 
-        self._timer.start()
+        self._cb_polling = QCheckBox("Poll for changes")
+        self._cb_polling.setChecked(False)
+        self._cb_polling.stateChanged.connect(
+            lambda *_: self._timer.start() if self._cb_polling.isChecked() else self._timer.stop())
+        self.layout().insertWidget(self.layout().indexOf(self._cb_live_update) + 1, self._cb_polling)
 
-        self.redraw()
+        self.redraw(background=False)
 
     @property
     def data(self):
         warnings.warn("PlotProfile().data is deprecated. Use PlotProfile().to_table() instead.", DeprecationWarning)
         return self._data
 
+    def closeEvent(self, event):
+        self._disconnect_viewer()
+        super().closeEvent(event)
+
+    def _disconnect_viewer(self, *_):
+        """Stop following the viewer, its layers and running redraws when the widget is closed or destroyed."""
+        if not self._connected:
+            return
+        self._connected = False
+        _stop_timer(self._redraw_timer)
+        _stop_timer(self._timer)
+        # running redraws are stopped and their results dropped
+        self._generation += 1
+        if self._worker is not None:
+            self._worker.quit()
+            self._worker = None
+
+        viewer = self._viewer
+        viewer.layers.selection.events.changed.disconnect(self._on_selection)
+        viewer.layers.events.inserted.disconnect(self._on_layer_inserted)
+        viewer.layers.events.removed.disconnect(self._on_layer_removed)
+        viewer.dims.events.current_step.disconnect(self._on_image_changed)
+        for layer in viewer.layers:
+            self._disconnect_layer(layer)
+
     def _on_selection(self, event):
         # redraw when layer selection has changed
         self.redraw(force_redraw=True)
 
+    def _on_refresh(self, event=None):
+        # recompute all profiles, e.g. after image data was modified in place
+        self.profile_cache.clear()
+        self._prefilter_cache.clear()
+        self.redraw(force_redraw=True)
 
-    def to_table(self):
+    def _connect_layer(self, layer):
+        if isinstance(layer, napari.layers.Shapes):
+            for name in _SHAPES_EVENTS:
+                getattr(layer.events, name).connect(self._on_line_changed)
+        elif isinstance(layer, napari.layers.Image):
+            layer.events.data.connect(self._on_data_changed)
+            for name in _IMAGE_EVENTS:
+                getattr(layer.events, name).connect(self._on_image_changed)
+
+    def _disconnect_layer(self, layer):
+        if isinstance(layer, napari.layers.Shapes):
+            for name in _SHAPES_EVENTS:
+                getattr(layer.events, name).disconnect(self._on_line_changed)
+        elif isinstance(layer, napari.layers.Image):
+            layer.events.data.disconnect(self._on_data_changed)
+            for name in _IMAGE_EVENTS:
+                getattr(layer.events, name).disconnect(self._on_image_changed)
+            self._data_versions.pop(id(layer), None)
+            self.profile_cache.invalidate(id(layer))
+            self._prefilter_cache.clear()
+
+    def _on_layer_inserted(self, event):
+        self._connect_layer(event.value)
+        self._schedule_redraw(force_redraw=True)
+
+    def _on_layer_removed(self, event):
+        self._disconnect_layer(event.value)
+        self._schedule_redraw(force_redraw=True)
+
+    def _on_line_changed(self, event=None):
+        # redraw() checks itself if the current line has changed
+        self._schedule_redraw()
+
+    def _on_data_changed(self, event):
+        layer = event.source
+        self._data_versions[id(layer)] = self._data_versions.get(id(layer), 0) + 1
+        self._prefilter_cache.clear()
+
+    def _on_image_changed(self, event=None):
+        self._schedule_redraw(force_redraw=True)
+
+    def _schedule_redraw(self, force_redraw : bool = False):
+        if not self._cb_live_update.isChecked():
+            return
+        self._force_redraw = self._force_redraw or force_redraw
+        if not self._redraw_timer.isActive():
+            self._redraw_timer.start()
+
+    def _on_redraw_timer(self):
+        force_redraw = self._force_redraw
+        self._force_redraw = False
+        self.redraw(force_redraw=force_redraw)
+
+
+    def to_table(self, table_type : str = 'dict'):
+        """Return the current profiles as table.
+
+        Parameters
+        ----------
+        table_type : str
+            'dict' returns a dictionary of NumPy arrays which share memory with the computed profiles,
+            'pandas' a pandas DataFrame and 'pyarrow' a pyarrow Table. Columns of profiles which are shorter than
+            others, e.g. because the line leaves one of the images, are padded with NaN in the latter two.
+        """
         table = {}
         for my_profile in self._data:
             positions = np.asarray(my_profile['positions'])
-            for i, x in enumerate(positions[0]):
+            for i in range(positions.shape[1]):
                 table[my_profile['name'] + '_pos' + str(i)] = positions[:, i]
 
             table[my_profile['name'] + '_intensity'] = my_profile['intensities']
             table[my_profile['name'] + '_distance'] = my_profile['distances']
-        return table
+
+        if table_type == 'dict':
+            return table
+        if table_type == 'pandas':
+            import pandas as pd
+            return pd.DataFrame({key: pd.Series(value, copy=False) for key, value in table.items()})
+        if table_type == 'pyarrow':
+            import pyarrow as pa
+            length = max([len(value) for value in table.values()], default=0)
+            return pa.table({key: np.pad(np.asarray(value, dtype=float), (0, length - len(value)), constant_values=np.nan)
+                             if len(value) < length else value for key, value in table.items()})
+        raise ValueError("table_type must be 'dict', 'pandas' or 'pyarrow'")
+
+    def export(self, filename : str, chunk_size : int = 1000000):
+        """Write the current profiles to a CSV or Parquet file, see `export_profiles()`."""
+        export_profiles(self._data, filename, chunk_size=chunk_size)
+
+    def _on_export(self, event=None):
+        filename, _ = QFileDialog.getSaveFileName(self, "Export profiles", "profiles.csv",
+                                                  "CSV (*.csv);;Parquet (*.parquet)")
+        if filename:
+            self.export(filename)
 
     def _list_values(self):
         table = self.to_table()
@@ -150,6 +343,58 @@ class PlotProfile(QWidget):
         from napari_skimage_regionprops import add_table
         add_table(first_selected_layer, self._viewer)
 
+    def _add_kymographs(self, event=None, background : bool = True):
+        line = self._get_current_line()
+        if line is None or len(self._viewer.dims.not_displayed) == 0:
+            return
+        line = self._slice_line(line)
+        viewer_axis = self._viewer.dims.not_displayed[0]
+        num_points = self._sp_num_points.value()
+        linewidth = self._sp_linewidth.value()
+        interpolation = self._cmb_interpolation.currentText()
+
+        layers = []
+        axes = []
+        for layer in self.selected_image_layers():
+            axis = viewer_axis - (self._viewer.dims.ndim - layer.ndim)
+            if layer.ndim == line.shape[1] and axis >= 0:
+                layers.append(layer)
+                axes.append(axis)
+
+        def compute():
+            return [kymograph(layer, line, axis=axis, num_points=num_points, linewidth=linewidth,
+                              interpolation=interpolation)
+                    for layer, axis in zip(layers, axes)]
+
+        def add_layers(kymographs):
+            for layer, axis, my_kymograph in zip(layers, axes, kymographs):
+                distances = my_kymograph['distances']
+                step = distances[1] - distances[0] if len(distances) > 1 else 1
+                self._viewer.add_image(my_kymograph['intensities'],
+                                       name=layer.name + ' kymograph',
+                                       colormap=layer.colormap,
+                                       blending='additive',
+                                       scale=(layer.scale[axis], step),
+                                       translate=(0, distances[0] if len(distances) > 0 else 0))
+
+        if not background:
+            add_layers(compute())
+            return
+
+        worker = thread_worker(compute, start_thread=False)()
+        worker.returned.connect(add_layers)
+        worker.start()
+
+    def _slice_line(self, line):
+        """Move the line to the currently displayed slice along the axes which are not displayed."""
+        dims = self._viewer.dims
+        line = np.array(line, dtype=float)
+        offset = dims.ndim - line.shape[1]
+        for axis in dims.not_displayed:
+            if axis - offset >= 0:
+                line[:, axis - offset] = dims.point[axis]
+        return line
+
     def _get_current_line(self):
         line = None
         for layer in self._viewer.layers.selection:
@@ -165,51 +410,137 @@ class PlotProfile(QWidget):
                     pass
         return line
 
-    def redraw(self, force_redraw : bool = False):
+    def redraw(self, force_redraw : bool = False, background : bool = True):
+        """Recompute the profiles along the current line and update the plot.
 
+        Profiles are computed in a background thread unless `background` is False. Results of requests which were
+        superseded by a later redraw are dropped.
+        """
         line = self._get_current_line()
 
         if line is None:
             #self._reset_plot()
             return
+        line = self._slice_line(line)
 
 
         if not force_redraw:
             if self._former_line is not None and np.array_equal(line, self._former_line):
                 return
 
-        self._reset_plot()
-
         self._former_line = line + 0
 
-        # clean up
-        layout = self._labels.layout()
-        for i in reversed(range(layout.count())):
-            layout.itemAt(i).widget().setParent(None)
+        # cancel the computation of former requests
+        self._generation += 1
+        if self._worker is not None:
+            self._worker.quit()
+            self._worker = None
+
+        layers = self.selected_image_layers()
+        settings = {
+            'num_points': self._sp_num_points.value(),
+            'full_resolution': self._cb_full_resolution.isChecked(),
+            'linewidth': self._sp_linewidth.value(),
+            'interpolation': self._cmb_interpolation.currentText(),
+        }
+        cache_keys = [self._cache_key(layer, line, settings) for layer in layers]
+        display_points = self._display_points()
+
+        def compute():
+            timings = {'sample': {}}
+            profiles = yield from _compute_profiles(layers, line, settings, cache=self.profile_cache,
+                                                    cache_keys=cache_keys, prefilter_cache=self._prefilter_cache,
+                                                    timings=timings['sample'])
+            # the plot shows a decimated copy, the profiles stay in full resolution for tables and export
+            start = time.perf_counter()
+            displays = [_envelope(my_profile['distances'], my_profile['intensities'], display_points)
+                        for my_profile in profiles]
+            timings['decimate'] = time.perf_counter() - start
+            return profiles, displays, timings
+
+        if not background:
+            self._show_profiles(self._generation, layers, _run_to_completion(compute()))
+            return
 
-        # visualize plots
-        num_bins = self._sp_num_points.value()
-        colors = []
+        worker = thread_worker(compute, start_thread=False)()
+        worker.returned.connect(partial(self._show_profiles, self._generation, layers))
+        self._worker = worker
+        worker.start()
+
+    def _cache_key(self, layer, line, settings : dict):
+        return (id(layer),
+                self._data_versions.get(id(layer), 0),
+                np.round(np.asarray(line, dtype=float), 6).tobytes(),
+                np.shape(line),
+                tuple(layer.scale),
+                tuple(sorted(settings.items())))
+
+    def _display_points(self):
+        """Number of points plotted per profile: a minimum and a maximum per pixel of the plot width."""
+        return 2 * max(self._graphics_widget.width(), 500)
+
+    def _show_profiles(self, generation, layers, result):
+        if generation != self._generation:
+            # a later request has been made in the meantime
+            return
+        self._worker = None
+        profiles, displays, timings = result
+        timings['plot'] = 0
+        timings['legend'] = 0
+
+        if not hasattr(self, "p2"):
+            self._reset_plot()
+
+        # remove plots and legend rows of layers which are not shown anymore
+        shown_layers = [layer for layer, my_profile in zip(layers, profiles) if len(my_profile['intensities']) > 0]
+        for layer in [layer for layer in self._plot_items if layer not in shown_layers]:
+            item, row = self._plot_items.pop(layer)
+            self.p2.removeItem(item)
+            row.setParent(None)
+
+        # visualize plots, reusing the plot items and legend rows of former redraws
         self._data = []
-        for i, layer in enumerate(self.selected_image_layers()):
-            # plot profile
-            my_profile = profile(layer, line, num_points=num_bins)
+        for layer, my_profile, (distances, intensities) in zip(layers, profiles, displays):
             my_profile['name'] = layer.name
             self._data.append(my_profile)
 
             colormap = layer.colormap.colors
             color = np.asarray(colormap[-1, 0:3]) * 255
-            colors.append(color)
 
-            intensities = my_profile['intensities']
             if len(intensities) > 0:
-                self.p2.plot(my_profile['distances'], intensities, pen=color, name=layer.name)
-
-                text = '[%0.2f .. %0.2f], %0.2f +- %0.2f' % (np.min(intensities),np.max(intensities),np.mean(intensities),np.std(intensities))
-
-                row = LayerLabelWidget(layer, text, colors[i], self)
+                text = '[%0.2f .. %0.2f], %0.2f +- %0.2f' % my_profile['statistics']
+
+                start = time.perf_counter()
+                if layer in self._plot_items:
+                    item, row = self._plot_items[layer]
+                    item.setData(distances, intensities)
+                    item.setPen(color)
+                    timings['plot'] += time.perf_counter() - start
+                    start = time.perf_counter()
+                    row.set_text(layer, text, color)
+                else:
+                    item = self.p2.plot(distances, intensities, pen=color, name=layer.name)
+                    timings['plot'] += time.perf_counter() - start
+                    start = time.perf_counter()
+                    row = LayerLabelWidget(layer, text, color, self)
+                    self._plot_items[layer] = (item, row)
+                timings['legend'] += time.perf_counter() - start
+
+        # keep the legend in layer order
+        start = time.perf_counter()
+        layout = self._labels.layout()
+        rows = [self._plot_items[layer][1] for layer in shown_layers]
+        if rows != [layout.itemAt(i).widget() for i in range(layout.count())]:
+            for row in rows:
+                layout.removeWidget(row)
+            for row in rows:
                 layout.addWidget(row)
+        timings['legend'] += time.perf_counter() - start
 
+        self.last_timings = timings
+        _logger.debug("redraw: sample %s, decimate %.4f s, plot %.4f s, legend %.4f s",
+                      ', '.join('%s %.4f s' % item for item in timings['sample'].items()),
+                      timings['decimate'], timings['plot'], timings['legend'])
 
     def _reset_plot(self):
         if not hasattr(self, "p2"):
@@ -221,6 +552,12 @@ class PlotProfile(QWidget):
         else:
             self.p2.clear()
 
+        # clean up
+        layout = self._labels.layout()
+        for i in reversed(range(layout.count())):
+            layout.itemAt(i).widget().setParent(None)
+        self._plot_items = {}
+
     def selected_image_layers(self):
         return [layer for layer in self._viewer.layers if (isinstance(layer, napari.layers.Image) and layer.visible)]
 
@@ -230,75 +567,302 @@ class LayerLabelWidget(QWidget):
 
         self.setLayout(QHBoxLayout())
 
-        lbl = QLabel(layer.name + text)
-        lbl.setStyleSheet('color: #%02x%02x%02x' % tuple(color.astype(int)))
-        self.layout().addWidget(lbl)
-
-def profile(layer, line, num_points : int = 256):
-    distance = 0
-    former_point = None
-    intermediate_distances = [0]
-    for point in line:
-        if former_point is not None:
-            distance = distance + np.linalg.norm(point - former_point)
-            intermediate_distances.append(distance)
-        former_point = point
-    intermediate_distances.append(intermediate_distances[-1])
-
-    step = distance / (num_points - 1)
-
-    positions = []
-    distances = []
-
-    current_line = 0
-    for i in range(num_points):
-        distance = i * step
-        while current_line < len(intermediate_distances) - 1 and distance > intermediate_distances[current_line + 1]:
-            current_line += 1
-        start = line[min(current_line, len(line) - 1)] / layer.scale
-        end = line[min(current_line + 1, len(line) - 1)] / layer.scale
-
-
-        position_on_line = distance - intermediate_distances[current_line]
-        if current_line == len(intermediate_distances)-1:
-            relative_position = 0
-        else:
-            line_length = intermediate_distances[current_line + 1] - intermediate_distances[current_line]
-            relative_position = position_on_line / line_length
-        position = end * relative_position + start * (1.0 - relative_position)
-
-        # check if point still within image
-        position_clipped = np.maximum(position, np.zeros(position.shape))
-        position_clipped = np.minimum(position_clipped, layer.data.shape - np.ones(position.shape))
-        if np.array_equal(position, position_clipped):
-            position = position.astype(int)
-            positions.append(position)
-            distances.append(i * step)
-
-    data = layer.data
-    if "dask" in str(type(data)):
-        data = np.asarray(data)
-
-    intensities = [data[tuple(position)] for position in positions]
-
-    return {
-        'positions': positions,
-        'distances': distances,
-        'intensities': intensities
-    }
+        self._label = QLabel()
+        self.set_text(layer, text, color)
+        self.layout().addWidget(self._label)
+
+    def set_text(self, layer, text, color):
+        self._label.setText(layer.name + text)
+        self._label.setStyleSheet('color: #%02x%02x%02x' % tuple(color.astype(int)))
+
+
+class ProfileCache:
+    """Least-recently-used cache of profiles, limited by the memory their arrays occupy.
+
+    Keys are tuples starting with the `id()` of the layer the profile was measured in.
+    """
+    def __init__(self, max_bytes : int = 256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _profile_nbytes(my_profile):
+        return sum(np.asarray(value).nbytes for value in my_profile.values() if not isinstance(value, str))
+
+    def get(self, key):
+        with self._lock:
+            my_profile = self._entries.get(key)
+            if my_profile is not None:
+                self._entries.move_to_end(key)
+            return my_profile
+
+    def put(self, key, my_profile):
+        nbytes = self._profile_nbytes(my_profile)
+        with self._lock:
+            if nbytes > self.max_bytes:
+                return
+            if key in self._entries:
+                self._nbytes -= self._profile_nbytes(self._entries.pop(key))
+            self._entries[key] = my_profile
+            self._nbytes += nbytes
+            # evict least recently used profiles
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= self._profile_nbytes(evicted)
+
+    def invalidate(self, layer_id : int):
+        """Remove all profiles of the layer with the given `id()`."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == layer_id]:
+                self._nbytes -= self._profile_nbytes(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _PrefilterCache(ProfileCache):
+    """Least-recently-used cache of spline coefficients, limited by the memory they occupy.
+
+    Entries are (image, coefficients, padding) tuples as stored by `_spline_coefficients()`; the image belongs to its
+    layer and is not counted.
+    """
+    @staticmethod
+    def _profile_nbytes(entry):
+        return entry[1].nbytes
+
+    def __setitem__(self, key, entry):
+        self.put(key, entry)
+
+
+def _compute_profiles(layers, line, settings : dict, cache : ProfileCache = None, cache_keys : list = None,
+                      prefilter_cache : dict = None, timings : dict = None):
+    """Compute the profiles of several layers along a line, yielding after each layer so that it can be cancelled.
+
+    `settings` and `prefilter_cache` are passed to `profile()` as keyword arguments. If `timings` is given, the
+    duration of measuring (or reading from the cache) each layer is stored in it by layer name.
+    """
+    profiles = []
+    for i, layer in enumerate(layers):
+        start = time.perf_counter()
+        my_profile = cache.get(cache_keys[i]) if cache is not None else None
+        if my_profile is None:
+            my_profile = profile(layer, line, prefilter_cache=prefilter_cache, **settings)
+            my_profile['statistics'] = _statistics(my_profile['intensities'])
+            if cache is not None:
+                cache.put(cache_keys[i], my_profile)
+        if timings is not None:
+            timings[layer.name] = time.perf_counter() - start
+        profiles.append(my_profile)
+        yield
+    return profiles
+
+
+def _statistics(intensities):
+    """Return minimum, maximum, mean and standard deviation of intensities."""
+    if len(intensities) == 0:
+        return (np.nan,) * 4
+    intensities = np.asarray(intensities)
+    mean = np.mean(intensities, dtype=float)
+    return float(np.min(intensities)), float(np.max(intensities)), float(mean), \
+        float(np.sqrt(np.mean(np.square(intensities - mean))))
+
+
+def _envelope(distances, intensities, max_points : int):
+    """Decimate a profile to at most `max_points` points for plotting, keeping minimum and maximum intensity of
+    consecutive bins of samples in their original order so that peaks remain visible. First and last sample are kept
+    as well."""
+    if len(intensities) <= max_points:
+        return distances, intensities
+
+    num_bins = (max_points - 2) // 2
+    bin_size = -(-len(intensities) // num_bins)
+    num_bins = -(-len(intensities) // bin_size)
+    # the last bin is filled up by repeating the last sample
+    indices = np.minimum(np.arange(num_bins * bin_size), len(intensities) - 1).reshape(num_bins, bin_size)
+    values = intensities[indices]
+
+    rows = np.arange(num_bins)
+    minima = indices[rows, np.argmin(values, axis=1)]
+    maxima = indices[rows, np.argmax(values, axis=1)]
+    selected = np.concatenate([[0], np.sort(np.stack([minima, maxima], axis=1), axis=1).ravel(),
+                               [len(intensities) - 1]])
+    return distances[selected], intensities[selected]
+
+
+def _run_to_completion(generator):
+    """Exhaust a generator and return its return value."""
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
 
 def min_max(data):
     return data.min(), data.max()
 
 class TopographicalVisualization(Enum):
-    Image = partial(topographic_image)
+    Image = partial(topographic_image, lazy=True)
     Points = partial(topographic_points)
     Surface = partial(topographic_surface)
 
+class _TopographicalAutoUpdate:
+    """Recompute the topographical view of a widget when the data of its source image layer changes.
+
+    Bursts of data events are coalesced. The computation runs in a background thread, one at a time: requests made
+    while it runs are combined into one more run after it has finished. Results of computations made before auto
+    update was switched off are dropped. Results are swapped into the existing output layers.
+    """
+
+    def __init__(self, widget, viewer=None, delay : int = 100):
+        self._widget = widget
+        self._explicit_viewer = viewer
+        self._layer = None
+        self._generation = 0
+        self._worker = None
+        # whether the view has to be recomputed once the running computation has finished
+        self._dirty = False
+
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self.update)
+
+        widget.changed.connect(self._on_widget_changed)
+        widget.native.destroyed.connect(partial(_call_on_destruction, weakref.WeakMethod(self.close)))
+
+    @property
+    def viewer(self):
+        if self._explicit_viewer is not None:
+            return self._explicit_viewer
+        from napari.utils._magicgui import find_viewer_ancestor
+        return find_viewer_ancestor(self._widget.native)
+
+    def bind(self, layer=None):
+        """Follow the data events of an image layer, by default the one selected in the widget, if auto update is
+        enabled."""
+        self._unbind()
+        if not self._widget.auto_update.value:
+            return
+
+        viewer = self.viewer
+        if layer is None and viewer is not None and self._widget.image.current_choice in viewer.layers:
+            layer = viewer.layers[self._widget.image.current_choice]
+        if layer is None:
+            return
+
+        self._layer = layer
+        layer.events.data.connect(self.schedule)
+        self.schedule()
+
+    def close(self, *_):
+        """Stop following the image layer and the widget, e.g. when the widget is destroyed."""
+        self._unbind()
+        self._widget.changed.disconnect(self._on_widget_changed)
+
+    def _unbind(self):
+        # stop following the layer and drop the results of pending and running computations
+        if self._layer is not None:
+            self._layer.events.data.disconnect(self.schedule)
+            self._layer = None
+        _stop_timer(self._timer)
+        self._generation += 1
+        self._dirty = False
+
+    def schedule(self, event=None):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def update(self, background : bool = True):
+        """Recompute the topographical view of the bound layer.
+
+        In the background, a computation which is requested while another one runs starts when the latter has
+        finished. Otherwise, the view is computed immediately and the result of a running computation is dropped.
+        """
+        if self._layer is None or self.viewer is None:
+            return
+
+        if background and self._worker is not None:
+            # a running computation cannot be interrupted; recompute once it has finished
+            self._dirty = True
+            return
+
+        self._generation += 1
+        widget = self._widget
+        compute = partial(_topographical_view, self._layer.data, widget.visualize_as.value, widget.step_size.value,
+                          widget.z_levels.value, widget.tile_size.value, widget.max_points.value,
+                          layers=self.viewer.layers)
+
+        if not background:
+            self._show(self._generation, compute())
+            return
+
+        worker = thread_worker(compute, start_thread=False)()
+        worker.returned.connect(partial(self._show, self._generation))
+        worker.finished.connect(self._on_worker_finished)
+        self._worker = worker
+        worker.start()
+
+    def _on_worker_finished(self):
+        self._worker = None
+        if self._dirty:
+            self._dirty = False
+            self.update()
+
+    def _show(self, generation, layer_data_tuples):
+        if generation != self._generation:
+            # a later request has been made in the meantime
+            return
+
+        viewer = self.viewer
+        for data, properties, layer_type in layer_data_tuples:
+            name = properties['name']
+            if name in viewer.layers and type(viewer.layers[name]).__name__.lower() == layer_type:
+                _update_layer(viewer.layers[name], data, properties)
+            else:
+                getattr(viewer, 'add_' + layer_type)(data, **properties)
+
+    def _on_widget_changed(self, *args):
+        self.bind()
+
+
+def _init_topographical_view(widget):
+    widget.auto_updater = _TopographicalAutoUpdate(widget)
+
+
+def _topographical_view(image, visualize_as : TopographicalVisualization, step_size : int = 1, z_levels : int = 0,
+                        tile_size : int = 0, max_points : int = 1000000, layers=None) -> List[LayerDataTuple]:
+    z_levels = z_levels if z_levels > 0 else None
+
+    if visualize_as == TopographicalVisualization.Image:
+        if layers is not None:
+            # volumes of topographical image layers in `layers` are reused, new ones are computed lazily
+            return _topographic_image(np.asarray(image), step_size, lazy=True, z_levels=z_levels, layers=layers)
+        return visualize_as.value(np.asarray(image), step_size, z_levels=z_levels)
+
+    if tile_size == 0:
+        image = np.asarray(image)
+    tile_size = tile_size if tile_size > 0 else None
+
+    if visualize_as == TopographicalVisualization.Points:
+        return visualize_as.value(image, step_size, z_levels=z_levels, tile_size=tile_size,
+                                  max_points=max_points if max_points > 0 else None)
+    return visualize_as.value(image, step_size, z_levels=z_levels, tile_size=tile_size)
+
+
 @register_dock_widget(menu="Visualization > Topographical view (npp)")
-@magic_factory(step_size={"visible": True})
+@magic_factory(step_size={"visible": True}, z_levels={"max": 65535}, tile_size={"max": 65536, "step": 256},
+               max_points={"max": 100000000, "step": 100000}, widget_init=_init_topographical_view)
 def topographical_view(image: ImageData, visualize_as:TopographicalVisualization = TopographicalVisualization.Image,
-                       step_size: int = 1) -> List[LayerDataTuple]:
+                       step_size: int = 1, z_levels: int = 0, tile_size: int = 0,
+                       max_points: int = 1000000, auto_update: bool = False) -> List[LayerDataTuple]:
     """Return a 3D topographical view from a 2D image.
 
     This function warps pixels intensities to heights and returns a 3D visualization as specified.
@@ -306,25 +870,26 @@ def topographical_view(image: ImageData, visualize_as:TopographicalVisualization
     Parameters
     ----------
     image : 2D-array
-        Grayscale 2D input image; will be converted to int internally
+        Grayscale 2D input image
     visualize_as: TopographicalVisualization
         Type of visualization: Image(s), Points or Surfaces
     step_size : uint
         Grid-size for the visualization
+    z_levels : uint
+        Number of height levels intensities are quantized into; 0 means one level per intensity unit
+    tile_size : uint
+        Process points and surfaces in tiles of this size in parallel, reading large (e.g. dask) images tile by
+        tile; 0 means the whole image at once
+    max_points : uint
+        Maximum number of points; larger images are shown as points representing the maximum of square cells of
+        pixels. 0 means no limit
+    auto_update : bool
+        Recompute the view in the background whenever the data of the image layer changes
 
     Returns
     -------
     napari layers : list of LayerDataTuple
         napari layers displaying pixel intensities as heights.
     """
-    image = np.asarray(image)
-    if not isinstance(image.dtype, int):
-        image = image.astype(int)
-
-    return visualize_as.value(image, step_size)
-
+    return _topographical_view(image, visualize_as, step_size, z_levels, tile_size, max_points)
 
-@napari_hook_implementation
-def napari_experimental_provide_dock_widget():
-    # you can return either a single widget, or a sequence of widgets
-    return [PlotProfile, topographical_view]
@@ -1,56 +1,216 @@
-from typing import List
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, TYPE_CHECKING
 
 import numpy as np
-from napari.types import LayerDataTuple, ImageData
-from skimage import measure
-from napari.utils.colormaps import colormap_utils
-import napari
+
+if TYPE_CHECKING:
+    # napari is imported when the functions are used, not when this module is imported
+    import napari
+    from napari.types import LayerDataTuple, ImageData
+
+
 def _get_3D_indices(image, sample_factor):
-    # Get (z, y, x) coordinates (z are image intensities)
-    z_indices = image.ravel().astype(int)[::sample_factor]
-    y_indices = np.indices(image.shape)[0].ravel()[::sample_factor]
-    x_indices = np.indices(image.shape)[1].ravel()[::sample_factor]
+    """Return (z, y, x) coordinates of every `sample_factor`-th pixel along y and x; z are image intensities.
+
+    Coordinates are built for the strided grid only and use the smallest integer types which fit them; z fits also
+    when negated, and y and x fit the coordinates of `image`.
+    """
+    sampled = np.asarray(image[::sample_factor, ::sample_factor])
+    z_indices = sampled.astype(int).ravel()
+    if z_indices.size > 0:
+        largest_magnitude = max(-int(z_indices.min()), int(z_indices.max()))
+        z_indices = z_indices.astype(np.min_scalar_type(-largest_magnitude - 1))
+
+    coordinate_type = np.min_scalar_type(-max(image.shape))
+    y_indices = np.repeat(np.arange(0, image.shape[0], sample_factor, dtype=coordinate_type), sampled.shape[1])
+    x_indices = np.tile(np.arange(0, image.shape[1], sample_factor, dtype=coordinate_type), sampled.shape[0])
     return z_indices, y_indices, x_indices
 
 
-def _topographic_image_positive(image, sample_factor):
-    """Generate a 3D topographical image from a 2D positive image."""
+def _topographic_heights(image, sample_factor):
+    """Return the heights of sampled pixels of a 2D positive image; pixels which are not sampled are -1."""
     max_range = np.ceil(image.max()).astype(int)
-    z_indices, y_indices, x_indices = _get_3D_indices(image, sample_factor)
-
-    # For each position, gets all (z,y,x) coordinates smaller than z:
-    # - for every z: arange an array from 0 to z
-    filled_z_indices = np.concatenate([np.arange(z_indices[i]+1)
-                                       for i in range(len(z_indices))])
-    # - for every x/y: repeat x/y by z times
-    filled_y_indices = np.repeat(y_indices,  z_indices+1)
-    filled_x_indices = np.repeat(x_indices,  z_indices+1)
-
-    # Create a 3D image and fills it
-    output_image = np.zeros((max_range+1,
-                             image.shape[0],
-                             image.shape[1])).astype(int)
-    output_image[filled_z_indices,
-                 filled_y_indices,
-                 filled_x_indices] = filled_z_indices
+    heights = np.full(image.shape, -1, dtype=np.min_scalar_type(-max_range - 1))
+    sampled_heights = heights[::sample_factor, ::sample_factor]
+    sampled_heights[:] = _get_3D_indices(image, sample_factor)[0].reshape(sampled_heights.shape)
+    return heights
+
+
+def _update_topographic_image_positive(output_image, heights, new_heights, sign: int = 1):
+    """Update a 3D topographical image generated from `heights` in place to represent `new_heights`.
+
+    Only pixels whose height changed are rewritten, and only in the z-planes between their former and new height.
+    With `sign` -1, the image holds negated z values as in the negative topographical image.
+    """
+    ys, xs = np.nonzero(heights != new_heights)
+    if len(ys) == 0:
+        return
+    former, new = heights[ys, xs], new_heights[ys, xs]
+    first_plane = int(np.minimum(former, new).min()) + 1
+    last_plane = int(np.maximum(former, new).max())
+
+    z = np.arange(first_plane, last_plane + 1, dtype=output_image.dtype)[:, np.newaxis]
+    output_image[first_plane:last_plane + 1, ys, xs] = sign * z * (z <= new)
+
+
+def _topographic_layer_data(image, sample_factor, lazy: bool = False, layer=None, sign: int = 1):
+    """Return layer data and heights of a positive or negative (`sign` -1) topographical image of a positive image.
+
+    If a `layer` is given which holds a volume of the same shape and type, that volume is returned unchanged instead of
+    a new one; `_update_layer()` then updates it in place to display the returned heights.
+    """
+    heights = _topographic_heights(image, sample_factor)
+
+    if layer is not None:
+        former_heights = layer.metadata.get('topographic_heights')
+        shape = (np.ceil(image.max()).astype(int) + 1,) + image.shape
+        if isinstance(layer.data, np.ndarray) and layer.data.shape == shape and layer.data.dtype == heights.dtype \
+                and former_heights is not None and former_heights.shape == heights.shape:
+            return layer.data, heights
+
+    output_image = _topographic_image_positive(image, sample_factor, lazy=lazy)
+    return (output_image[::-1] if sign > 0 else -output_image), heights
+
+
+def _update_layer(layer, data, properties):
+    """Show the data and properties of a layer data tuple in an existing layer.
+
+    If `data` is the volume of a topographical image layer, as returned by `_topographic_layer_data()`, it is updated
+    in place from the heights in the layer's metadata to the heights in `properties`.
+    """
+    for key, value in properties.items():
+        if key not in ('name', 'metadata'):
+            setattr(layer, key, value)
+
+    metadata = properties.get('metadata', {})
+    if layer.data is data and 'topographic_heights' in metadata:
+        sign = metadata.get('topographic_sign', 1)
+        # positive images are displayed upside down
+        output_image = data[::-1] if sign > 0 else data
+        _update_topographic_image_positive(output_image, layer.metadata['topographic_heights'],
+                                           metadata['topographic_heights'], sign)
+        layer.metadata.update(metadata)
+        layer.refresh()
+    else:
+        layer.metadata.update(metadata)
+        layer.data = data
+
+
+def _topographic_image_positive(image, sample_factor, lazy: bool = False):
+    """Generate a 3D topographical image from a 2D positive image.
+
+    If `lazy`, a dask array is returned which computes z-planes only when they are accessed.
+    """
+    max_range = np.ceil(image.max()).astype(int)
+    heights = _topographic_heights(image, sample_factor)
+
+    # Fill every (z, y, x) with z where z is smaller or equal than the height at (y, x).
+    # Planes are processed in chunks to limit the size of temporary arrays.
+    chunk_size = max(1, 2 ** 22 // max(image.size, 1))
+
+    if lazy:
+        import dask.array as da
+        z = da.arange(max_range + 1, chunks=chunk_size, dtype=heights.dtype)[:, np.newaxis, np.newaxis]
+        return z * (z <= heights)
+
+    output_image = np.zeros((max_range + 1,) + image.shape, dtype=heights.dtype)
+    for start in range(0, max_range + 1, chunk_size):
+        z = np.arange(start, min(start + chunk_size, max_range + 1), dtype=heights.dtype)[:, np.newaxis, np.newaxis]
+        np.multiply(z, z <= heights, out=output_image[start:start + len(z)])
 
     return output_image
 
 
-def topographic_image(image: ImageData, step_size: int = 1, viewer: napari.Viewer = None) -> List[LayerDataTuple]:
-    """Generate 3D topographical image layers from a 2D image."""
+def _quantize(image, z_levels: int = None):
+    """Scale intensities so that they span at most `z_levels` z-planes on either side of zero.
+
+    Returns the scaled image and the intensity difference between two z-planes. If `z_levels` is not given, every
+    intensity unit is one z-plane.
+    """
+    z_scale = _z_scale(image, z_levels)
+    if z_scale == 1:
+        return image, 1
+    # the division may end up an ulp beyond z_levels, which would add a z-plane
+    return np.clip(image / z_scale, -z_levels, z_levels), z_scale
+
+
+def _z_scale(image, z_levels: int = None):
+    """Return the intensity difference between two z-planes when quantizing an image into `z_levels` z-planes."""
+    if not z_levels:
+        return 1
+    max_intensity = float(np.abs(image).max())
+    if max_intensity == 0:
+        return 1
+    return max_intensity / z_levels
+
+
+def _tiles(size: int, tile_size: int = None, overlap: int = 0):
+    """Return (start, stop) of tiles covering an axis of given size; consecutive tiles share `overlap` elements."""
+    if not tile_size or tile_size >= size:
+        return [(0, size)]
+    starts = range(0, size - overlap, tile_size - overlap)
+    return [(start, min(start + tile_size, size)) for start in starts]
+
+
+def _map_tiles(function, tiles, parallel: bool = True):
+    """Apply a function to all tiles, in parallel threads if there are several."""
+    if parallel and len(tiles) > 1:
+        with ThreadPoolExecutor() as executor:
+            return list(executor.map(function, tiles))
+    return [function(tile) for tile in tiles]
+
+
+def topographic_image(image: ImageData, step_size: int = 1, viewer: napari.Viewer = None,
+                      lazy: bool = False, z_levels: int = None) -> List[LayerDataTuple]:
+    """Generate 3D topographical image layers from a 2D image.
+
+    If `lazy`, new layers hold dask arrays which compute z-planes when napari displays them instead of allocating the
+    whole 3D volume. Volumes of existing layers in the `viewer` are updated in place if they have the same shape and
+    type. If `z_levels` is given, intensities are quantized into that many z-planes and the layers are
+    scaled accordingly, making the size of the volume independent of the image's bit depth.
+    """
+    output_layer_data_tuple_list = _topographic_image(image, step_size, lazy=lazy, z_levels=z_levels,
+                                                      layers=viewer.layers if viewer is not None else None)
+
+    for layer in output_layer_data_tuple_list:
+        if viewer is not None:
+            if layer[1]['name'] not in viewer.layers:
+                viewer.add_image(layer[0], **layer[1])
+            else:
+                _update_layer(viewer.layers[layer[1]['name']], layer[0], layer[1])
+    return output_layer_data_tuple_list
+
+
+def _topographic_image(image, step_size: int = 1, lazy: bool = False, z_levels: int = None,
+                       layers=None) -> List[LayerDataTuple]:
+    """Return the layer data tuples of `topographic_image()` without adding them to a viewer.
+
+    Volumes of the topographical image layers in `layers` are returned for reuse without modifying them, see
+    `_topographic_layer_data()`. Layers are only read, so that this can run in a background thread.
+    """
+    image, z_scale = _quantize(image, z_levels)
+
+    def existing_layer(name):
+        return layers[name] if layers is not None and name in layers else None
 
     output_layer_data_tuple_list = []
 
     positive_image = np.clip(image, a_min=0, a_max=None)
+    # number of z-planes above zero, as in _topographic_image_positive()
+    max_range = int(np.ceil(positive_image.max()))
 
     # assemble LayerDataTuple
-    layer_data = _topographic_image_positive(positive_image, step_size)[::-1]
+    layer_data, heights = _topographic_layer_data(positive_image, step_size, lazy=lazy,
+                                                  layer=existing_layer('topographical image'))
     layer_properties = {'name': 'topographical image',
-                        'translate': (-int(image.max()), 0, 0),
+                        'scale': (z_scale, 1, 1),
+                        'translate': (-max_range * z_scale, 0, 0),
                         'blending': 'additive',
                         'rendering': 'mip',
-                        'colormap': 'gist_earth'}
+                        'colormap': 'gist_earth',
+                        'metadata': {'topographic_heights': heights}}
     layer_type = 'image'
 
     output_layer_data_tuple_list.append((layer_data, layer_properties, layer_type))
@@ -60,71 +220,217 @@ def topographic_image(image: ImageData, step_size: int = 1, viewer: napari.Viewe
         negative_image = -np.clip(image, a_min=None, a_max=0)
 
         # assemble LayerDataTuple
-        layer_data = -_topographic_image_positive(negative_image, step_size)
+        layer_data, heights = _topographic_layer_data(negative_image, step_size, lazy=lazy, sign=-1,
+                                                      layer=existing_layer('topographical image negative'))
         layer_properties = {'name': 'topographical image negative',
+                            'scale': (z_scale, 1, 1),
                             'translate': (0, 0, 0),
                             'blending': 'additive',
                             'rendering': 'minip',
-                            'colormap': get_inferno_rev_cmap()}
+                            'colormap': get_inferno_rev_cmap(),
+                            'metadata': {'topographic_heights': heights, 'topographic_sign': -1}}
 
         output_layer_data_tuple_list.append((layer_data, layer_properties, layer_type))
-        
-    for layer in output_layer_data_tuple_list:
-        if viewer is not None:
-            if layer[1]['name'] not in viewer.layers:
-                viewer.add_image(layer[0], **layer[1])
-            else:
-                _layer = viewer.layers[layer[1]]['name']
-                _layer.data = layer[0]
-                _layer.properties = layer[1]
+
     return output_layer_data_tuple_list
 
 
-def topographic_points(image: ImageData, step_size: int = 1) -> List[LayerDataTuple]:
-    """Generate points in 3D from a 2D image."""
-    z_indices, y_indices, x_indices = _get_3D_indices(image, step_size)
-    points = np.stack((z_indices, y_indices, x_indices), axis=1)
+_POOLING_FUNCTIONS = {'max': np.nanmax, 'mean': np.nanmean}
+
+
+def _lod_cell_size(shape, step_size: int, max_points: int = None):
+    """Return the smallest grid spacing, not smaller than `step_size`, giving at most `max_points` grid cells."""
+    cell_size = step_size
+    if max_points:
+        cell_size = max(cell_size, int(np.sqrt(shape[0] * shape[1] / max_points)))
+        while -(-shape[0] // cell_size) * -(-shape[1] // cell_size) > max_points:
+            cell_size += 1
+    return cell_size
+
+
+def _pool(image, cell_size: int, pooling: str = 'max'):
+    """Reduce every `cell_size` x `cell_size` cell of a 2D image to one value; cells on the border may be smaller."""
+    rows = -(-image.shape[0] // cell_size)
+    columns = -(-image.shape[1] // cell_size)
+    padded = np.full((rows * cell_size, columns * cell_size), np.nan)
+    padded[:image.shape[0], :image.shape[1]] = image
+    return _POOLING_FUNCTIONS[pooling](padded.reshape(rows, cell_size, columns, cell_size), axis=(1, 3))
+
+
+def topographic_points(image: ImageData, step_size: int = 1, z_levels: int = None,
+                       tile_size: int = None, max_points: int = None, pooling: str = 'max') -> List[LayerDataTuple]:
+    """Generate points in 3D from a 2D image.
+
+    Every `step_size`-th pixel along y and x is sampled. If `z_levels` is given, heights are quantized into that many
+    levels. If `tile_size` is given, the image is read in stripes of that many rows, in parallel, which allows
+    processing dask or zarr images larger than memory.
+
+    If `max_points` is given and sampling would produce more points, a level of detail is chosen instead: the image
+    is divided into a coarser grid of square cells with at most `max_points` cells and each cell is represented by one
+    point at its center, with the maximum or mean intensity of the cell, depending on `pooling`.
+    """
+    if pooling not in _POOLING_FUNCTIONS:
+        raise ValueError("pooling must be one of " + str(list(_POOLING_FUNCTIONS)))
+
+    z_scale = _z_scale(image, z_levels)
+    cell_size = _lod_cell_size(image.shape, step_size, max_points)
+    is_pooled = cell_size > step_size
+    grid_rows = -(-image.shape[0] // cell_size)
+    grid_columns = -(-image.shape[1] // cell_size)
 
-    points[:, 0] = -points[:, 0]
+    # points are written into a preallocated array, stripe by stripe
+    points = np.empty((grid_rows * grid_columns, 3), dtype=int if z_scale == 1 else float)
+
+    def sample_stripe(stripe):
+        start, stop = stripe
+        if is_pooled:
+            stripe_image = _pool(np.asarray(image[start * cell_size:stop * cell_size]), cell_size, pooling)
+            z_indices, y_indices, x_indices = _get_3D_indices(stripe_image / z_scale, 1)
+            y_indices = np.minimum(y_indices.astype(int) * cell_size + (cell_size - 1) // 2, image.shape[0] - 1 - start * cell_size)
+            x_indices = np.minimum(x_indices.astype(int) * cell_size + (cell_size - 1) // 2, image.shape[1] - 1)
+        else:
+            stripe_image = image[start * cell_size:(stop - 1) * cell_size + 1]
+            if z_scale != 1:
+                stripe_image = stripe_image / z_scale
+            z_indices, y_indices, x_indices = _get_3D_indices(stripe_image, cell_size)
+
+        output = points[start * grid_columns:stop * grid_columns]
+        np.multiply(z_indices, -z_scale, out=output[:, 0], casting='unsafe')
+        # stripe coordinates only fit the stripe; shift them in a type which fits the whole image
+        np.add(y_indices.astype(np.intp), start * cell_size, out=output[:, 1], casting='unsafe')
+        output[:, 2] = x_indices
+
+    stripe_rows = None if not tile_size else max(1, tile_size // cell_size)
+    _map_tiles(sample_stripe, _tiles(grid_rows, stripe_rows))
 
     # assemble LayerDataTuple
     magic_number = 30000
     layer_data = points
     layer_properties = {'name': 'topographical points',
-                        'size': max(int(round(image.size / magic_number)), 1)}
+                        'size': cell_size if is_pooled else max(int(round(image.size / magic_number)), 1)}
     layer_type = 'points'
 
     return [(layer_data, layer_properties, layer_type)]
 
 
-def topographic_surface(image: ImageData, step_size: int = 1) -> List[LayerDataTuple]:
-    """Generate a surface from a 2D image."""
-    # Get topographic image(s)
-    layerDataTuples = topographic_image(image, step_size=1)
-    output_list = [layer[0] for layer in layerDataTuples]
+def _grid_indices(size: int, step_size: int):
+    """Return every `step_size`-th index along an axis of given size, including the last one."""
+    indices = np.arange(0, size, step_size)
+    if indices[-1] != size - 1:
+        indices = np.append(indices, size - 1)
+    return indices
+
+
+def _heightmap_mesh(heights, max_error: float = None, tile_size: int = 8):
+    """Triangulate a 2D heightmap with one vertex per pixel and two triangles per quad of four neighboring pixels.
+
+    If `max_error` is given, tiles of `tile_size` x `tile_size` quads in which heights differ by at most `max_error`
+    are triangulated as a fan around the tile center instead. All vertices on tile borders are kept, so that the mesh
+    has no cracks. Returns the (y, x) grid positions of used vertices and faces indexing them.
+    """
+    rows, columns = heights.shape
+    index = np.arange(rows * columns).reshape(rows, columns)
+    is_quad_triangulated = np.ones((rows - 1, columns - 1), dtype=bool)
+    faces = []
+
+    if max_error is not None and rows > tile_size and columns > tile_size:
+        tile_rows = (rows - 1) // tile_size
+        tile_columns = (columns - 1) // tile_size
+        windows = np.lib.stride_tricks.sliding_window_view(heights, (tile_size + 1, tile_size + 1))
+        windows = windows[::tile_size, ::tile_size][:tile_rows, :tile_columns]
+        is_flat = windows.max(axis=(2, 3)) - windows.min(axis=(2, 3)) <= max_error
+
+        tile_quads = is_quad_triangulated[:tile_rows * tile_size, :tile_columns * tile_size]
+        tile_quads.reshape(tile_rows, tile_size, tile_columns, tile_size)[:] &= ~is_flat[:, np.newaxis, :, np.newaxis]
+
+        # clockwise ring of border vertices and center of a tile, relative to its top-left vertex
+        steps = np.arange(tile_size)
+        ring = np.concatenate([steps,
+                               tile_size + steps * columns,
+                               tile_size * columns + tile_size - steps,
+                               (tile_size - steps) * columns])
+        center = (tile_size // 2) * columns + tile_size // 2
+
+        origins = index[:tile_rows * tile_size:tile_size, :tile_columns * tile_size:tile_size][is_flat]
+        fan = np.stack([np.full(len(ring), center), ring, np.roll(ring, -1)], axis=1)
+        faces.append((origins[:, np.newaxis, np.newaxis] + fan[np.newaxis]).reshape(-1, 3))
+
+    top_left = index[:-1, :-1][is_quad_triangulated]
+    top_right = index[:-1, 1:][is_quad_triangulated]
+    bottom_left = index[1:, :-1][is_quad_triangulated]
+    bottom_right = index[1:, 1:][is_quad_triangulated]
+    faces.append(np.stack([top_left, top_right, bottom_left], axis=1))
+    faces.append(np.stack([top_right, bottom_right, bottom_left], axis=1))
+    faces = np.concatenate(faces)
 
-    # If list has 2 images, concatenate them
-    if len(output_list) > 1:
-        output_image = np.concatenate(
-            (output_list[0][1:],
-             output_list[1])
-            )
+    # remove vertices within simplified tiles
+    is_used = np.zeros(rows * columns, dtype=bool)
+    is_used[faces] = True
+    new_index = np.cumsum(is_used) - 1
+    return np.flatnonzero(is_used), new_index[faces]
+
+
+def topographic_surface(image: ImageData, step_size: int = 1, z_levels: int = None,
+                        max_error: float = None, tile_size: int = None) -> List[LayerDataTuple]:
+    """Generate a surface from a 2D image.
+
+    The image is triangulated directly as height field, sampling every `step_size`-th pixel. If `z_levels` is given,
+    heights are quantized into that many levels and the layer is scaled accordingly. If `max_error` is given, flat
+    regions, in which intensities differ by at most `max_error`, are represented by fewer triangles. If `tile_size`
+    is given, the image is read and triangulated in tiles of that many pixels in parallel, which allows processing
+    dask or zarr images larger than memory; tile meshes share their border vertices.
+    """
+    z_scale = _z_scale(image, z_levels)
+
+    y_indices = _grid_indices(image.shape[0], step_size)
+    x_indices = _grid_indices(image.shape[1], step_size)
+    columns = len(x_indices)
+
+    def triangulate(tile):
+        (row_start, row_stop), (column_start, column_stop) = tile
+        tile_y = y_indices[row_start:row_stop]
+        tile_x = x_indices[column_start:column_stop]
+        region = np.asarray(image[tile_y[0]:tile_y[-1] + 1, tile_x[0]:tile_x[-1] + 1])
+        heights = region[np.ix_(tile_y - tile_y[0], tile_x - tile_x[0])].astype(float)
+        if z_levels:
+            heights = np.trunc(heights / z_scale)
+
+        used_vertices, faces = _heightmap_mesh(heights, None if max_error is None else max_error / z_scale)
+        vertex_y, vertex_x = np.unravel_index(used_vertices, heights.shape)
+        vertex_ids = (vertex_y + row_start) * columns + vertex_x + column_start
+        return vertex_ids, heights.ravel()[used_vertices], faces
+
+    # neighboring tiles overlap by one row/column of vertices
+    tile_vertices = None if not tile_size else max(2, tile_size // step_size)
+    tiles = [(rows, tile_columns) for rows in _tiles(len(y_indices), tile_vertices, overlap=1)
+             for tile_columns in _tiles(columns, tile_vertices, overlap=1)]
+    results = _map_tiles(triangulate, tiles)
+
+    if len(results) == 1:
+        vertex_ids, vertex_heights, faces = results[0]
     else:
-        output_image = output_list[0]
-    # offsets image to positive values to get surface where level = 0
-    offset = abs(output_image.min())
-    output_image[output_image != 0] += offset
-    vertices, faces, normals, values = measure.marching_cubes(output_image,
-                                                              level=0,
-                                                              step_size=step_size)
+        # stitch tiles: vertices on tile borders are shared
+        is_used = np.zeros(len(y_indices) * columns, dtype=bool)
+        grid_heights = np.zeros(len(y_indices) * columns)
+        for tile_vertex_ids, tile_heights, _ in results:
+            is_used[tile_vertex_ids] = True
+            grid_heights[tile_vertex_ids] = tile_heights
+        vertex_ids = np.flatnonzero(is_used)
+        vertex_heights = grid_heights[vertex_ids]
+        new_index = np.cumsum(is_used) - 1
+        faces = np.concatenate([new_index[tile_vertex_ids[tile_faces]] for tile_vertex_ids, _, tile_faces in results])
+
+    # heights point to negative z, like in topographic images and points
+    vertices = np.stack([-vertex_heights, y_indices[vertex_ids // columns], x_indices[vertex_ids % columns]], axis=1)
+    values = vertex_heights * z_scale
     surface = (vertices, faces, values)
 
     # assemble LayerDataTuple
     layer_data = surface
     layer_properties = {'name': 'topographical surface',
                         'colormap': 'gist_earth',
-                        'scale': (1, 1, 1),
-                        'translate': (-int(image.max()), 0, 0)}
+                        'scale': (z_scale, 1, 1),
+                        'translate': (0, 0, 0)}
     layer_type = 'surface'
 
     return [(layer_data, layer_properties, layer_type)]
@@ -132,6 +438,8 @@ def topographic_surface(image: ImageData, step_size: int = 1) -> List[LayerDataT
 
 def get_inferno_rev_cmap():
     """Revert inferno colormap and make last value transparent."""
+    from napari.utils.colormaps import colormap_utils
+
     inferno_colormap = colormap_utils.ensure_colormap('inferno')
     inferno_rev_colormap = {
       'colors': np.copy(inferno_colormap.colors)[::-1],
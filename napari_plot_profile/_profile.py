@@ -0,0 +1,521 @@
+"""Measure intensity profiles along lines in image layers.
+
+This module does not depend on Qt, so that profiles can be measured in scripts without loading a GUI.
+"""
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def _sample_lines(lines, num_points : int):
+    """Return equidistant sample positions along several polylines at once, their distances from the start of their
+    line, the direction of the line segment each of them lies on and the index of their line."""
+    lines = [np.asarray(line, dtype=float) for line in lines]
+    lines = [line if len(line) > 1 else np.concatenate([line, line]) for line in lines]
+    vertices = np.concatenate(lines)
+    vertex_counts = np.asarray([len(line) for line in lines])
+
+    # segments connect consecutive vertices of the same line
+    last_vertices = np.cumsum(vertex_counts) - 1
+    is_segment_start = np.ones(len(vertices), dtype=bool)
+    is_segment_start[last_vertices] = False
+    segment_starts = np.flatnonzero(is_segment_start)
+    segment_counts = vertex_counts - 1
+    first_segments = np.concatenate([[0], np.cumsum(segment_counts)[:-1]])
+    last_segments = first_segments + segment_counts - 1
+
+    # cumulative length of all lines at each of their vertices
+    segment_lengths = np.linalg.norm(vertices[segment_starts + 1] - vertices[segment_starts], axis=1)
+    intermediate_distances = np.concatenate([[0], np.cumsum(segment_lengths)])
+    line_lengths = intermediate_distances[last_segments + 1] - intermediate_distances[first_segments]
+
+    line_index = np.repeat(np.arange(len(lines)), num_points)
+    steps = line_lengths / (num_points - 1)
+    distances = np.tile(np.arange(num_points), len(lines)) * steps[line_index]
+
+    # index of the segment each sample falls into
+    global_distances = intermediate_distances[first_segments][line_index] + distances
+    segment = np.searchsorted(intermediate_distances[1:], global_distances, side='left')
+    segment = np.clip(segment, first_segments[line_index], last_segments[line_index])
+
+    line_length = segment_lengths[segment]
+    position_on_line = global_distances - intermediate_distances[segment]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_position = np.where(line_length > 0, position_on_line / line_length, 0)
+    relative_position = np.clip(relative_position, 0, 1)[:, np.newaxis]
+
+    start = vertices[segment_starts[segment]]
+    end = vertices[segment_starts[segment] + 1]
+    # exact in axes along which the line does not change, e.g. the current slice
+    positions = start + (end - start) * relative_position
+
+    return positions, distances, end - start, line_index
+
+
+def _sample_line(line, num_points : int):
+    """Return equidistant sample positions along a polyline, their distances from its start and the direction of
+    the line segment each of them lies on."""
+    positions, distances, directions, _ = _sample_lines([line], num_points)
+    return positions, distances, directions
+
+
+def _chunk_starts(data):
+    """Return the index of the first pixel of every chunk along each axis of a dask/zarr array."""
+    starts = []
+    for size, chunks in zip(data.shape, data.chunks):
+        if np.isscalar(chunks):
+            # zarr: one chunk size per axis
+            starts.append(np.arange(0, size, chunks))
+        else:
+            # dask: explicit chunk sizes per axis
+            starts.append(np.cumsum((0,) + tuple(chunks[:-1])))
+    return starts
+
+
+def _group_by_chunk(data, positions):
+    """Return the indices of integer positions grouped by the chunk of a chunked array they fall into."""
+    chunk_indices = np.stack([np.searchsorted(starts, positions[:, axis], side='right') - 1
+                              for axis, starts in enumerate(_chunk_starts(data))], axis=1)
+    _, chunk_of_point = np.unique(chunk_indices, axis=0, return_inverse=True)
+    chunk_of_point = chunk_of_point.ravel()
+
+    order = np.argsort(chunk_of_point, kind='stable')
+    boundaries = np.flatnonzero(np.diff(chunk_of_point[order])) + 1
+    return np.split(order, boundaries)
+
+
+def _gather_chunked(data, positions):
+    """Read pixel values at integer positions from a chunked array, loading only chunks the positions fall into."""
+    intensities = np.empty(len(positions), dtype=data.dtype)
+    if len(positions) == 0:
+        return intensities
+
+    groups = _group_by_chunk(data, positions)
+
+    def read(points):
+        # read the bounding box of the points within one chunk only
+        lower = positions[points].min(axis=0)
+        upper = positions[points].max(axis=0) + 1
+        block = np.asarray(data[tuple(slice(l, u) for l, u in zip(lower, upper))])
+        intensities[points] = block[tuple((positions[points] - lower).T)]
+
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(read, groups))
+
+    return intensities
+
+
+def _gather(data, positions):
+    """Read pixel values at integer positions (one row per point) from an image."""
+    if isinstance(data, np.ndarray):
+        return data[tuple(positions.T)]
+    if hasattr(data, "chunks") and data.chunks is not None:
+        return _gather_chunked(data, positions)
+    return np.asarray(data)[tuple(positions.T)]
+
+
+def _multiscale_level(layer, pixel_step : float, full_resolution : bool = False):
+    """Return the coarsest pyramid level of a layer which still provides at least one pixel per sample."""
+    if not layer.multiscale or full_resolution:
+        return 0
+    downsample_factors = np.max(np.asarray(layer.downsample_factors), axis=1)
+    suitable_levels = np.flatnonzero(downsample_factors <= pixel_step)
+    if len(suitable_levels) == 0:
+        return 0
+    return int(suitable_levels[-1])
+
+
+def _perpendicular_offsets(directions, linewidth : int):
+    """Return offsets of `linewidth` points across the line, perpendicular to the given directions, in the plane of the
+    last two axes. Shape of the result is (number of directions, linewidth, dimensions)."""
+    normals = np.zeros_like(directions, dtype=float)
+    normals[:, -2] = -directions[:, -1]
+    normals[:, -1] = directions[:, -2]
+    norms = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, norms, out=np.zeros_like(normals), where=norms > 0)
+
+    offsets = np.arange(linewidth) - (linewidth - 1) / 2
+    return offsets[np.newaxis, :, np.newaxis] * normals[:, np.newaxis, :]
+
+
+# pixels around an image (or a part of it) which the spline prefilter takes into account
+_SPLINE_PADDING = 12
+
+
+def _spline_coefficients(data, order : int, prefilter_cache : dict = None, plane : tuple = ()):
+    """Return the spline coefficients of an image, or of the plane of it selected by the index `plane`, for
+    interpolation of given order and the padding added around them, as computed by `map_coordinates()` before every
+    interpolation. They are stored in and reused from `prefilter_cache` if given."""
+    key = (id(data), order, tuple(index if isinstance(index, int) else None for index in plane))
+    # the entry is read once, as the cache may be cleared in another thread
+    entry = prefilter_cache.get(key) if prefilter_cache is not None else None
+    if entry is not None and entry[0] is data:
+        return entry[1:]
+
+    from scipy import ndimage as ndi
+
+    # pad like map_coordinates() does so that the spline continues beyond the image edge
+    padding = _SPLINE_PADDING
+    coefficients = ndi.spline_filter(np.pad(data[plane], padding, mode='edge'), order, output=float, mode='nearest')
+    if prefilter_cache is not None:
+        # the image is referenced so that its id cannot be reused while the entry exists
+        prefilter_cache[key] = (data, coefficients, padding)
+    return coefficients, padding
+
+
+def _interpolate(data, coordinates, order : int, prefilter_cache : dict = None):
+    """Read an image at sub-pixel coordinates (one row per point) using spline interpolation of given order.
+    Points outside the image are NaN. Spline coefficients of in-memory images are reused from `prefilter_cache`."""
+    from scipy import ndimage as ndi
+
+    values = np.full(len(coordinates), np.nan)
+    upper_bounds = np.asarray(data.shape) - 1
+    inside = np.all((coordinates >= 0) & (coordinates <= upper_bounds), axis=1)
+    if not inside.any():
+        return values
+    coordinates = coordinates[inside]
+
+    # axes along which all points lie on the same pixel plane, e.g. the displayed slice of a stack, need no
+    # interpolation: only that plane is read and prefiltered
+    fixed = np.all(coordinates == np.round(coordinates[0]), axis=0)
+    if order == 0 or fixed.all():
+        values[inside] = _gather(data, np.round(coordinates).astype(int))
+        return values
+
+    if isinstance(data, np.ndarray):
+        plane = tuple(int(round(c)) if is_fixed else slice(None) for c, is_fixed in zip(coordinates[0], fixed))
+        coordinates = coordinates[:, ~fixed]
+        if order > 1 and prefilter_cache is not None:
+            coefficients, padding = _spline_coefficients(data, order, prefilter_cache, plane)
+            values[inside] = ndi.map_coordinates(coefficients, coordinates.T + padding, order=order, mode='nearest',
+                                                 prefilter=False, output=float)
+        else:
+            values[inside] = ndi.map_coordinates(data[plane], coordinates.T, order=order, mode='nearest',
+                                                 output=float)
+        return values
+
+    # read windows around the coordinates only, with a margin for the spline: linear interpolation reads the next
+    # pixel, the prefilter of higher orders depends on neighbors which lose influence quickly with distance
+    margin = np.where(fixed, 0, order if order <= 1 else _SPLINE_PADDING)
+
+    def read(points):
+        lower = np.maximum(np.floor(coordinates[points].min(axis=0)).astype(int) - margin, 0)
+        upper = np.minimum(np.ceil(coordinates[points].max(axis=0)).astype(int) + margin + 1, upper_bounds + 1)
+        window = np.asarray(data[tuple(slice(l, u) for l, u in zip(lower, upper))])
+        return ndi.map_coordinates(window, (coordinates[points] - lower).T, order=order, mode='nearest', output=float)
+
+    if not (hasattr(data, "chunks") and data.chunks is not None):
+        values[inside] = read(np.arange(len(coordinates)))
+        return values
+
+    # one window per chunk the coordinates fall into, like _gather_chunked()
+    groups = _group_by_chunk(data, np.floor(coordinates).astype(int))
+    inside_values = np.empty(len(coordinates))
+    with ThreadPoolExecutor() as executor:
+        for points, group_values in zip(groups, executor.map(read, groups)):
+            inside_values[points] = group_values
+    values[inside] = inside_values
+    return values
+
+
+# 'truncate' reads the pixel which contains a position with coordinates rounded towards zero
+_INTERPOLATION_ORDERS = {'truncate': 0, 'nearest': 0, 'linear': 1, 'cubic': 3}
+_REDUCE_FUNCTIONS = {'mean': np.nanmean, 'median': np.nanmedian, 'max': np.nanmax}
+
+
+def _check_sampling_options(reduce_func : str, interpolation : str):
+    if interpolation not in _INTERPOLATION_ORDERS:
+        raise ValueError("interpolation must be one of " + str(list(_INTERPOLATION_ORDERS)))
+    if reduce_func not in _REDUCE_FUNCTIONS:
+        raise ValueError("reduce_func must be one of " + str(list(_REDUCE_FUNCTIONS)))
+
+
+def _measure(data, coordinates, reduce_func : str, interpolation : str, prefilter_cache : dict = None):
+    """Read intensities at pixel coordinates of shape (points, band width, dimensions) in one batch and reduce them
+    across the band. Points outside the image are NaN."""
+    num_points, linewidth, dimensions = coordinates.shape
+    if interpolation == 'truncate':
+        positions = coordinates.reshape(-1, dimensions).astype(int)
+        inside = np.all((coordinates.reshape(-1, dimensions) >= 0) & (positions < np.asarray(data.shape)), axis=1)
+        if linewidth == 1 and inside.all():
+            return _gather(data, positions)
+        values = np.full(len(positions), np.nan)
+        values[inside] = _gather(data, positions[inside])
+    else:
+        values = _interpolate(data, coordinates.reshape(-1, dimensions), _INTERPOLATION_ORDERS[interpolation],
+                              prefilter_cache)
+    if linewidth == 1:
+        return values
+    values = values.reshape(num_points, linewidth)
+    with warnings.catch_warnings():
+        # band points outside the image are NaN and ignored
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return _REDUCE_FUNCTIONS[reduce_func](values, axis=1)
+
+
+def profile(layer, line, num_points : int = 256, full_resolution : bool = False, linewidth : int = 1,
+            reduce_func : str = 'mean', interpolation : str = 'truncate', keep_outside : bool = False,
+            prefilter_cache : dict = None):
+    """Measure intensities along a line in an image layer.
+
+    Parameters
+    ----------
+    layer : napari.layers.Image
+        Image layer to measure in; multiscale and dask/zarr-backed layers are supported.
+    line : array
+        Vertices of the line (or path) in world coordinates, one row per vertex.
+    num_points : int
+        Number of equidistant samples along the line.
+    full_resolution : bool
+        Measure multiscale images in the full-resolution level instead of the coarsest suitable level.
+    linewidth : int
+        Width of the band perpendicular to the line which is averaged, in pixels.
+    reduce_func : str
+        How intensities across the band are combined: 'mean', 'median' or 'max'.
+    interpolation : str
+        How intensities are read between pixels: 'truncate' (the pixel containing the position, with coordinates
+        rounded towards zero), 'nearest', 'linear' or 'cubic' (spline interpolation).
+    keep_outside : bool
+        Return all `num_points` samples, with NaN intensities outside the image, instead of only those within.
+    prefilter_cache : dict, optional
+        Dictionary in which spline coefficients of in-memory images, or of the plane of a stack the line lies in, are
+        kept and reused for cubic interpolation along other lines. Entries must be removed when the image data is
+        modified in place.
+
+    Returns
+    -------
+    dict
+        'positions' (pixel coordinates), 'distances' (along the line) and 'intensities' of the samples within the image.
+    """
+    _check_sampling_options(reduce_func, interpolation)
+
+    positions, distances, directions = _sample_line(line, num_points)
+
+    # distance between samples in pixels, used for choosing the pyramid level of multiscale images
+    path_length = np.sum(np.linalg.norm(np.diff(np.asarray(line) / np.asarray(layer.scale), axis=0), axis=1))
+
+    within_image, positions, intensities = _measure_layer(layer, positions, directions, path_length / (num_points - 1),
+                                                          full_resolution, linewidth, reduce_func, interpolation,
+                                                          keep_outside, prefilter_cache)
+
+    return {
+        'positions': positions,
+        'distances': distances[within_image],
+        'intensities': intensities
+    }
+
+
+def _measure_layer(layer, positions, directions, pixel_step : float, full_resolution : bool, linewidth : int,
+                   reduce_func : str, interpolation : str, keep_outside : bool = False, prefilter_cache : dict = None):
+    """Measure intensities in an image layer at sample positions and line directions given in world coordinates.
+
+    Returns which samples are measured (those within the image unless `keep_outside`), their positions in pixel
+    coordinates and their intensities.
+    """
+    positions = positions / np.asarray(layer.scale)
+    directions = directions / np.asarray(layer.scale)
+
+    # only keep points within the image
+    upper_bounds = np.asarray(layer.level_shapes[0]) - 1
+    within_image = np.all((positions >= 0) & (positions <= upper_bounds), axis=1)
+    outside_image = ~within_image
+    if keep_outside:
+        within_image = np.ones(len(positions), dtype=bool)
+
+    level = _multiscale_level(layer, pixel_step, full_resolution)
+    data = layer.data[level] if layer.multiscale else layer.data
+    downsample_factors = np.asarray(layer.downsample_factors[level])
+
+    if linewidth == 1 and interpolation == 'truncate':
+        positions = positions[within_image].astype(int)
+        coordinates = positions[:, np.newaxis, :]
+    else:
+        positions = positions[within_image]
+        coordinates = positions[:, np.newaxis, :] + _perpendicular_offsets(directions[within_image], linewidth)
+
+    intensities = _measure(data, coordinates / downsample_factors, reduce_func, interpolation, prefilter_cache)
+    if keep_outside and outside_image.any():
+        intensities = intensities.astype(float)
+        intensities[outside_image] = np.nan
+
+    # column-major, so that every coordinate axis is a contiguous column in tables
+    return within_image, np.asfortranarray(positions), intensities
+
+
+def profile_all(shapes_layer, image_layers, num_points : int = 256, full_resolution : bool = False,
+                linewidth : int = 1, reduce_func : str = 'mean', interpolation : str = 'truncate',
+                parallel : bool = True):
+    """Measure profiles along all lines and paths of a shapes layer in several image layers.
+
+    All lines are sampled at once and each image layer is read in one batch.
+
+    Parameters
+    ----------
+    shapes_layer : napari.layers.Shapes
+        Layer containing the lines and paths; other shape types are ignored.
+    image_layers : list of napari.layers.Image
+        Layers to measure in.
+    num_points, full_resolution, linewidth, reduce_func, interpolation
+        See `profile()`; apply to every line.
+    parallel : bool
+        Measure the image layers in parallel threads.
+
+    Returns
+    -------
+    dict
+        Table in long format with one row per sample within an image: columns 'layer' (name), 'shape_index' (index of
+        the shape in the shapes layer), 'distance', 'intensity' and 'pos0', 'pos1', ... (pixel coordinates).
+    """
+    _check_sampling_options(reduce_func, interpolation)
+
+    shape_indices = np.asarray([i for i, shape_type in enumerate(shapes_layer.shape_type)
+                                if shape_type in ('line', 'path')], dtype=int)
+    ndim = shapes_layer.ndim
+    table = {'layer': np.asarray([], dtype=str), 'shape_index': np.asarray([], dtype=int),
+             'distance': np.asarray([], dtype=float), 'intensity': np.asarray([], dtype=float)}
+    for axis in range(ndim):
+        table['pos' + str(axis)] = np.asarray([], dtype=float)
+    if len(shape_indices) == 0 or len(image_layers) == 0:
+        return table
+
+    lines = [shapes_layer.data[i] for i in shape_indices]
+    positions, distances, directions, line_index = _sample_lines(lines, num_points)
+
+    def measure(layer):
+        # choose pyramid levels by the most densely sampled line
+        pixel_step = min(np.sum(np.linalg.norm(np.diff(np.asarray(line) / np.asarray(layer.scale), axis=0), axis=1))
+                         for line in lines) / (num_points - 1)
+        return _measure_layer(layer, positions, directions, pixel_step, full_resolution, linewidth, reduce_func,
+                              interpolation)
+
+    if parallel and len(image_layers) > 1:
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(measure, image_layers))
+    else:
+        results = [measure(layer) for layer in image_layers]
+
+    columns = {key: [] for key in table}
+    for layer, (within_image, layer_positions, intensities) in zip(image_layers, results):
+        columns['layer'].append(np.full(len(intensities), layer.name))
+        columns['shape_index'].append(shape_indices[line_index[within_image]])
+        columns['distance'].append(distances[within_image])
+        columns['intensity'].append(intensities)
+        for axis in range(ndim):
+            columns['pos' + str(axis)].append(layer_positions[:, axis])
+
+    return {key: np.concatenate(values) for key, values in columns.items()}
+
+
+def kymograph(layer, line, axis : int = 0, num_points : int = 256, linewidth : int = 1, reduce_func : str = 'mean',
+              interpolation : str = 'truncate'):
+    """Measure the profile along the same line in every slice along an axis, e.g. in every timepoint.
+
+    The coordinate of the line along `axis` is ignored. All slices are read in one batch; for dask/zarr-backed layers
+    only the chunks the line crosses are loaded, chunk by chunk and in parallel. Multiscale layers are measured in
+    full resolution.
+
+    Parameters
+    ----------
+    layer : napari.layers.Image
+        Image layer with at least one dimension more than the line is drawn in.
+    line : array
+        Vertices of the line (or path) in world coordinates, one row per vertex.
+    axis : int
+        Axis along which the slices are taken.
+    num_points, linewidth, reduce_func, interpolation
+        See `profile()`.
+
+    Returns
+    -------
+    dict
+        'distances' (along the line) of the samples within the image, 'slices' (indices along `axis`) and
+        'intensities' as 2D array of shape (slices, distances).
+    """
+    _check_sampling_options(reduce_func, interpolation)
+
+    data = layer.data[0] if layer.multiscale else layer.data
+    scale = np.asarray(layer.scale)
+
+    line = np.array(line, dtype=float)
+    line[:, axis] = 0
+    positions, distances, directions = _sample_line(line, num_points)
+    positions = positions / scale
+    directions = directions / scale
+
+    # only keep points within the image
+    upper_bounds = np.asarray(data.shape) - 1
+    within_image = np.all((positions >= 0) & (positions <= upper_bounds), axis=1)
+    distances = distances[within_image]
+    positions = positions[within_image]
+
+    if linewidth == 1 and interpolation == 'truncate':
+        coordinates = positions.astype(int)[:, np.newaxis, :]
+    else:
+        coordinates = positions[:, np.newaxis, :] + _perpendicular_offsets(directions[within_image], linewidth)
+
+    # the same coordinates in every slice
+    slices = np.arange(data.shape[axis])
+    coordinates = np.repeat(coordinates[np.newaxis], len(slices), axis=0)
+    coordinates[..., axis] = slices[:, np.newaxis, np.newaxis]
+
+    intensities = _measure(data, coordinates.reshape((-1,) + coordinates.shape[2:]), reduce_func, interpolation)
+
+    return {
+        'distances': distances,
+        'slices': slices,
+        'intensities': intensities.reshape(len(slices), len(distances))
+    }
+
+
+def export_profiles(profiles, filename : str, chunk_size : int = 1000000):
+    """Write profiles to a CSV or Parquet file (depending on the file extension) in long format.
+
+    The file has the columns 'layer', 'distance', 'intensity' and 'pos0', 'pos1', ... with one row per sample. Profiles
+    are written in chunks of `chunk_size` rows without building the whole table in memory. Writing Parquet files
+    requires pyarrow.
+
+    Parameters
+    ----------
+    profiles : list of dict
+        Profiles as returned by `profile()` with an additional 'name' entry, e.g. `PlotProfile().data`.
+    filename : str
+        Path of the '.csv' or '.parquet' file to write.
+    chunk_size : int
+        Maximum number of rows written at once.
+    """
+    ndim = max([np.asarray(my_profile['positions']).shape[1] for my_profile in profiles], default=0)
+    position_columns = ['pos' + str(axis) for axis in range(ndim)]
+
+    def chunks():
+        for my_profile in profiles:
+            positions = np.asarray(my_profile['positions'])
+            for start in range(0, len(my_profile['intensities']), chunk_size):
+                end = start + chunk_size
+                yield my_profile['name'], my_profile['distances'][start:end], my_profile['intensities'][start:end], \
+                      positions[start:end]
+
+    if str(filename).endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Exporting to Parquet requires pyarrow. Install it using 'pip install pyarrow'.")
+
+        schema = pa.schema([('layer', pa.string()), ('distance', pa.float64()), ('intensity', pa.float64())] +
+                           [(column, pa.float64()) for column in position_columns])
+        with pq.ParquetWriter(str(filename), schema) as writer:
+            for name, distances, intensities, positions in chunks():
+                columns = [pa.repeat(name, len(distances)),
+                           pa.array(distances, pa.float64()),
+                           pa.array(intensities, pa.float64())] + \
+                          [pa.array(positions[:, axis], pa.float64()) for axis in range(positions.shape[1])]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        return
+
+    with open(filename, 'w', newline='') as file:
+        file.write(','.join(['layer', 'distance', 'intensity'] + position_columns) + '\n')
+        for name, distances, intensities, positions in chunks():
+            quoted_name = '"' + name.replace('"', '""').replace('%', '%%') + '"'
+            fmt = ','.join([quoted_name] + ['%.17g'] * (2 + positions.shape[1]))
+            np.savetxt(file, np.column_stack([distances, intensities, positions]), fmt=fmt)
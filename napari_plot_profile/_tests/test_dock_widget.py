@@ -57,3 +57,453 @@ def test_run_topographical_widget(make_napari_viewer, array, expected_types):
     output_layer_types = [layer.as_layer_data_tuple()[-1]
                           for layer in viewer.layers[1:]]
     assert sorted(expected_types) == sorted(output_layer_types)
+
+
+def test_redraw_on_events(qtbot):
+    """Test that changing the line redraws the plot once after a burst of events."""
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+
+    viewer = ViewerModel()
+    viewer.add_image(np.random.random((256, 256)))
+    shapes = viewer.add_shapes([[100, 80], [140, 150]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+
+    redraws = []
+    plotter.redraw = lambda force_redraw=False: redraws.append(force_redraw)
+    for i in range(10):
+        shapes.data = [np.asarray([[100, 80], [140, 150 + i]])]
+    qtbot.waitUntil(lambda: len(redraws) > 0)
+    qtbot.wait(50)
+    assert len(redraws) == 1
+
+    viewer.layers[0].scale = (2, 2)
+    qtbot.waitUntil(lambda: len(redraws) > 1)
+    assert redraws[-1]
+
+
+def test_disconnect_on_close(qtbot):
+    """Test that closed and destroyed widgets do not follow the viewer anymore."""
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+
+    viewer = ViewerModel()
+    image = viewer.add_image(np.random.random((5, 256, 256)))
+    shapes = viewer.add_shapes([[2, 100, 80], [2, 140, 150]], shape_type='path')
+    emitters = [viewer.layers.events.inserted, viewer.layers.events.removed, viewer.dims.events.current_step,
+                viewer.layers.selection.events.changed, image.events.data, image.events.colormap, shapes.events.data]
+    connections = [len(emitter.callbacks) for emitter in emitters]
+
+    plotter = PlotProfile(viewer)
+    plotter.close()
+    redraws = []
+    plotter.redraw = lambda *args, **kwargs: redraws.append(1)
+    plotter._schedule_redraw = lambda *args, **kwargs: redraws.append(1)
+    shapes.data = [np.asarray([[2, 0, 0], [2, 0, 30]])]
+    image.colormap = 'magenta'
+    viewer.dims.set_current_step(0, 3)
+    viewer.layers.selection.active = image
+    viewer.add_image(np.random.random((5, 256, 256)))
+    qtbot.wait(50)
+    assert len(redraws) == 0
+
+    plotter = PlotProfile(viewer)
+    plotter.deleteLater()
+    qtbot.waitUntil(lambda: [len(emitter.callbacks) for emitter in emitters] == connections)
+
+
+def test_disconnect_on_application_exit():
+    """Test that widgets which are still alive when the application is torn down disconnect without errors."""
+    import os
+    import subprocess
+    import sys
+
+    code = ("import numpy as np\n"
+            "from qtpy.QtWidgets import QApplication\n"
+            "from napari.components import ViewerModel\n"
+            "import napari_plot_profile\n"
+            "from napari_plot_profile._dock_widget import _TopographicalAutoUpdate\n"
+            "app = QApplication([])\n"
+            "viewer = ViewerModel()\n"
+            "layer = viewer.add_image(np.random.random((20, 20)))\n"
+            "viewer.add_shapes([[1, 1], [10, 10]], shape_type='path')\n"
+            "plotter = napari_plot_profile.PlotProfile(viewer)\n"
+            "widget = napari_plot_profile.topographical_view()\n"
+            "widget.auto_update.value = True\n"
+            "updater = _TopographicalAutoUpdate(widget, viewer=viewer)\n"
+            "updater.bind(layer)\n"
+            "del app\n")
+    environment = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=environment)
+    assert result.returncode == 0
+    assert 'Traceback' not in result.stderr
+
+
+def test_redraw_in_background(qtbot):
+    """Test that only the result of the latest redraw request is shown."""
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+
+    viewer = ViewerModel()
+    viewer.add_image(np.random.random((256, 256)))
+    shapes = viewer.add_shapes([[100, 80], [140, 150]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+
+    for length in [10, 20, 30]:
+        shapes.data = [np.asarray([[0, 0], [0, length]])]
+        plotter.redraw()
+    qtbot.waitUntil(lambda: plotter._worker is None)
+
+    assert plotter.to_table()['Image_distance'][-1] == 30
+
+
+def test_redraw_reuses_plot_items(qtbot):
+    """Test that plot items and legend rows are updated in place."""
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+
+    viewer = ViewerModel()
+    image = viewer.add_image(np.random.random((256, 256)))
+    shapes = viewer.add_shapes([[100, 80], [140, 150]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+    item, row = plotter._plot_items[image]
+
+    shapes.data = [np.asarray([[0, 0], [0, 30]])]
+    plotter.redraw(background=False)
+    assert plotter._plot_items[image] == (item, row)
+    assert item.xData[-1] == 30
+
+    image.visible = False
+    plotter.redraw(force_redraw=True, background=False)
+    assert len(plotter._plot_items) == 0
+    assert plotter._labels.layout().count() == 0
+
+
+def test_envelope():
+    from napari_plot_profile._dock_widget import _envelope
+
+    distances = np.arange(100001) * 0.5
+    intensities = np.random.random(100001)
+    intensities[12345] = 10
+    intensities[54321] = -10
+
+    plot_distances, plot_intensities = _envelope(distances, intensities, 1000)
+    assert len(plot_intensities) <= 1000
+    assert np.all(np.diff(plot_distances) >= 0)
+    assert plot_intensities.max() == 10 and plot_intensities.min() == -10
+    assert plot_distances[0] == 0 and plot_distances[-1] == distances[-1]
+
+    # every plotted point is a sample of the profile
+    assert np.array_equal(intensities[(plot_distances * 2).astype(int)], plot_intensities)
+
+    # short profiles are plotted as they are
+    plot_distances, plot_intensities = _envelope(distances[:1000], intensities[:1000], 1000)
+    assert np.array_equal(plot_intensities, intensities[:1000])
+
+
+def test_plot_decimation(qtbot):
+    """Test that long profiles are plotted decimated and listed in full resolution."""
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+
+    viewer = ViewerModel()
+    image = viewer.add_image(np.random.random((256, 256)))
+    viewer.add_shapes([[10, 10], [250, 240]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+    plotter._sp_num_points.setValue(200000)
+    plotter.redraw(force_redraw=True, background=False)
+
+    item, row = plotter._plot_items[image]
+    assert len(item.yData) <= plotter._display_points()
+    intensities = plotter.to_table()['Image_intensity']
+    assert len(intensities) == 200000
+    assert item.yData.max() == intensities.max()
+    assert plotter._data[0]['statistics'] == pytest.approx((intensities.min(), intensities.max(),
+                                                            intensities.mean(), intensities.std()))
+
+
+def test_redraw_timings(qtbot, caplog):
+    """Test that the durations of the redraw steps are recorded and logged."""
+    import logging
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+
+    viewer = ViewerModel()
+    viewer.add_image(np.random.random((64, 64)), name='first')
+    viewer.add_image(np.random.random((64, 64)), name='second')
+    viewer.add_shapes([[10, 10], [50, 60]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+    with caplog.at_level(logging.DEBUG, logger='napari_plot_profile'):
+        plotter.redraw(force_redraw=True, background=False)
+
+    timings = plotter.last_timings
+    assert list(timings['sample']) == ['first', 'second']
+    assert all(timings[key] >= 0 for key in ['decimate', 'plot', 'legend'])
+    assert 'redraw: sample first' in caplog.text
+
+
+def test_profile_cache(qtbot, monkeypatch):
+    """Test that redrawing a former line reuses cached profiles."""
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+    from napari_plot_profile import _dock_widget
+
+    viewer = ViewerModel()
+    image = viewer.add_image(np.random.random((256, 256)))
+    shapes = viewer.add_shapes([[100, 80], [140, 150]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+    shapes.data = [np.asarray([[0, 0], [0, 30]])]
+    plotter.redraw(background=False)
+    assert len(plotter.profile_cache) == 2
+
+    computed = []
+    original_profile = _dock_widget.profile
+    monkeypatch.setattr(_dock_widget, 'profile', lambda *args, **kwargs: computed.append(1) or original_profile(*args, **kwargs))
+
+    shapes.data = [np.asarray([[100, 80], [140, 150]])]
+    plotter.redraw(background=False)
+    plotter.redraw(force_redraw=True, background=False)
+    assert len(computed) == 0
+
+    # changing the data invalidates the cache
+    image.data = np.random.random((256, 256))
+    plotter.redraw(force_redraw=True, background=False)
+    assert len(computed) == 1
+
+
+def test_profile_cache_memory_budget():
+    from napari_plot_profile._dock_widget import ProfileCache
+
+    cache = ProfileCache(max_bytes=2000)
+    for i in range(3):
+        cache.put((i,), {'intensities': np.zeros(100)})
+    cache.get((1,))
+    cache.put((3,), {'intensities': np.zeros(100)})
+
+    assert cache.get((0,)) is None
+    assert cache.get((2,)) is None
+    assert cache.get((1,)) is not None
+    assert cache.get((3,)) is not None
+
+    # spline coefficients are counted, the images they belong to are not
+    from napari_plot_profile._dock_widget import _PrefilterCache
+    from napari_plot_profile._profile import _spline_coefficients
+    image = np.random.random((20, 20))
+    prefilter_cache = _PrefilterCache(max_bytes=2 * 44 * 44 * 8)
+    for i in range(3):
+        _spline_coefficients(image, 3, prefilter_cache, (slice(None),) * 2)
+        _spline_coefficients(image + i, 3, prefilter_cache)
+    assert len(prefilter_cache) == 2
+
+
+def test_kymograph_widget(qtbot):
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile, kymograph
+
+    viewer = ViewerModel()
+    image = viewer.add_image(np.random.random((5, 50, 60)))
+    viewer.add_shapes([[[2, 5, 5], [2, 40, 50]]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+
+    # the profile follows the current slice
+    viewer.dims.set_current_step(0, 4)
+    plotter.redraw(background=False)
+    assert np.all(plotter.to_table()['Image_pos0'] == 4)
+
+    plotter._add_kymographs(background=False)
+    assert viewer.layers[-1].name == 'Image kymograph'
+    assert viewer.layers[-1].data.shape == (5, 100)
+
+    # with the interpolation chosen in the widget
+    viewer.layers.remove('Image kymograph')
+    viewer.layers.selection.active = viewer.layers['Shapes']
+    plotter._cmb_interpolation.setCurrentText('cubic')
+    plotter._add_kymographs(background=False)
+    reference = kymograph(image, np.asarray([[4, 5, 5], [4, 40, 50]]), axis=0, num_points=100, interpolation='cubic')
+    assert np.allclose(viewer.layers[-1].data, reference['intensities'])
+
+
+def test_topographical_view_auto_update(qtbot):
+    from napari.components import ViewerModel
+    from napari_plot_profile._dock_widget import _TopographicalAutoUpdate
+
+    viewer = ViewerModel()
+    image = np.random.randint(0, 20, (10, 12))
+    layer = viewer.add_image(image)
+
+    widget = napari_plot_profile.topographical_view()
+    widget.visualize_as.value = napari_plot_profile.TopographicalVisualization.Points
+    updater = _TopographicalAutoUpdate(widget, viewer=viewer, delay=0)
+
+    # nothing happens until auto update is enabled
+    updater.bind(layer)
+    assert len(viewer.layers) == 1
+
+    widget.auto_update.value = True
+    updater.bind(layer)
+    qtbot.waitUntil(lambda: 'topographical points' in viewer.layers)
+    points_layer = viewer.layers['topographical points']
+    assert np.array_equal(points_layer.data, napari_plot_profile.topographic_points(image)[0][0])
+
+    # data changes are swapped into the existing layer
+    layer.data = image * 2
+    layer.data = image * 3
+    qtbot.waitUntil(lambda: points_layer.data[:, 0].min() == -3 * image.max())
+    assert len(viewer.layers) == 2
+    assert viewer.layers['topographical points'] is points_layer
+
+    # outdated results are dropped
+    updater.update(background=True)
+    layer.data = image * 4
+    updater.update(background=False)
+    qtbot.wait(100)
+    assert points_layer.data[:, 0].min() == -4 * image.max()
+
+    widget.auto_update.value = False
+    updater.bind()
+    layer.data = image
+    qtbot.wait(100)
+    assert points_layer.data[:, 0].min() == -4 * image.max()
+
+    # the layer is not followed anymore once the widget is destroyed
+    widget.auto_update.value = True
+    updater.bind(layer)
+    qtbot.waitUntil(lambda: updater._worker is None and not updater._timer.isActive())
+    connections = len(layer.events.data.callbacks)
+    widget.native.deleteLater()
+    qtbot.waitUntil(lambda: len(layer.events.data.callbacks) == connections - 1)
+    layer.data = image * 5
+    qtbot.wait(100)
+    assert points_layer.data[:, 0].min() == -image.max()
+
+
+def test_topographical_view_auto_update_image_in_place(qtbot):
+    from napari.components import ViewerModel
+    from napari_plot_profile._dock_widget import _TopographicalAutoUpdate
+
+    viewer = ViewerModel()
+    image = np.random.randint(0, 20, (10, 12))
+    image[0, 0] = 20
+    layer = viewer.add_image(image)
+
+    widget = napari_plot_profile.topographical_view()
+    widget.visualize_as.value = napari_plot_profile.TopographicalVisualization.Image
+    widget.auto_update.value = True
+    updater = _TopographicalAutoUpdate(widget, viewer=viewer, delay=0)
+    updater.bind(layer)
+    qtbot.waitUntil(lambda: 'topographical image' in viewer.layers)
+    qtbot.waitUntil(lambda: updater._worker is None)
+
+    # new volumes are computed lazily
+    image_layer = viewer.layers['topographical image']
+    assert not isinstance(image_layer.data, np.ndarray)
+    assert np.array_equal(np.asarray(image_layer.data), napari_plot_profile.topographic_image(image)[0][0])
+
+    # a volume in memory is updated in place when the image keeps its value range
+    image_layer.data = napari_plot_profile.topographic_image(image)[0][0]
+    volume = image_layer.data
+    changed = image.copy()
+    changed[3:6, 4:8] = np.random.randint(0, 20, (3, 4))
+    layer.data = changed
+    qtbot.waitUntil(lambda: updater._worker is None and not updater._timer.isActive())
+    qtbot.wait(50)
+    expected = napari_plot_profile.topographic_image(changed)[0]
+    assert image_layer.data is volume
+    assert np.array_equal(image_layer.data, expected[0])
+    assert np.array_equal(image_layer.metadata['topographic_heights'], expected[1]['metadata']['topographic_heights'])
+
+
+def test_topographical_view_auto_update_runs_one_at_a_time(qtbot, monkeypatch):
+    import time
+    from napari.components import ViewerModel
+    from napari_plot_profile import _dock_widget
+
+    viewer = ViewerModel()
+    image = np.random.randint(0, 20, (10, 12))
+    layer = viewer.add_image(image)
+
+    running = []
+    calls = []
+    original = _dock_widget._topographical_view
+
+    def slow_topographical_view(data, *args, **kwargs):
+        running.append(1)
+        assert len(running) == 1
+        time.sleep(0.5)
+        calls.append(np.asarray(data).max())
+        running.pop()
+        return original(data, *args, **kwargs)
+    monkeypatch.setattr(_dock_widget, '_topographical_view', slow_topographical_view)
+
+    widget = napari_plot_profile.topographical_view()
+    widget.visualize_as.value = napari_plot_profile.TopographicalVisualization.Points
+    updater = _dock_widget._TopographicalAutoUpdate(widget, viewer=viewer, delay=0)
+    widget.auto_update.value = True
+    updater.bind(layer)
+
+    # data events while computing are combined into one more computation of the latest data
+    qtbot.waitUntil(lambda: len(running) == 1)
+    for factor in range(2, 10):
+        layer.data = image * factor
+        qtbot.wait(5)
+    qtbot.waitUntil(lambda: len(calls) == 2 and updater._worker is None, timeout=5000)
+    qtbot.wait(200)
+    assert calls == [image.max(), 9 * image.max()]
+    assert viewer.layers['topographical points'].data[:, 0].min() == -9 * image.max()
+
+
+def test_to_table_and_export(qtbot, tmp_path):
+    import pandas as pd
+    from napari.components import ViewerModel
+    from napari_plot_profile import PlotProfile
+
+    viewer = ViewerModel()
+    viewer.add_image(np.random.random((256, 256)), name='a')
+    viewer.add_image(np.random.random((256, 256)), name='b')
+    viewer.add_shapes([[100, 80], [140, 150]], shape_type='path')
+
+    plotter = PlotProfile(viewer)
+    qtbot.addWidget(plotter)
+
+    # columns share memory with the profiles
+    table = plotter.to_table()
+    assert np.shares_memory(table['a_intensity'], plotter._data[0]['intensities'])
+    assert np.shares_memory(table['a_pos1'], plotter._data[0]['positions'])
+    assert table['a_pos1'].flags['C_CONTIGUOUS']
+    assert plotter.to_table('pandas').shape == (100, 8)
+
+    plotter.export(tmp_path / 'profiles.csv', chunk_size=30)
+    exported = pd.read_csv(tmp_path / 'profiles.csv')
+    assert list(exported.columns) == ['layer', 'distance', 'intensity', 'pos0', 'pos1']
+    assert len(exported) == 200
+    assert np.allclose(exported['intensity'][exported['layer'] == 'b'], table['b_intensity'])
+
+    pytest.importorskip('pyarrow')
+    plotter.export(str(tmp_path / 'profiles.parquet'), chunk_size=30)
+    exported = pd.read_parquet(tmp_path / 'profiles.parquet')
+    assert len(exported) == 200
+    assert np.allclose(exported['pos0'][exported['layer'] == 'a'], table['a_pos0'])
+
+    # without a line there are no profiles to export
+    empty = PlotProfile(ViewerModel())
+    qtbot.addWidget(empty)
+    assert empty.to_table() == {}
+    assert len(empty.to_table('pandas')) == 0
+    for filename in ['empty.csv', 'empty.parquet']:
+        empty.export(str(tmp_path / filename))
+    assert len(pd.read_csv(tmp_path / 'empty.csv')) == 0
+    assert len(pd.read_parquet(tmp_path / 'empty.parquet')) == 0
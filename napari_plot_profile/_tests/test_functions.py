@@ -12,7 +12,7 @@ def test_topographical_view_image_positive_only():
                         [[0, 0], [2, 2]],
                         [[0, 1], [1, 1]],
                         [[0, 0], [0, 0]]
-                        ])]
+                        ], dtype=np.int8)]
 
     print(result_data)
 
@@ -28,12 +28,12 @@ def test_topographical_view_image_positive_and_negative():
                         [[0, 0], [2, 2]],
                         [[0, 1], [1, 1]],
                         [[0, 0], [0, 0]]
-                        ]),
+                        ], dtype=np.int8),
                       np.asarray([
                         [[0, 0], [0, 0]],
                         [[-1, 0], [0, 0]],
                         [[0, 0], [0, 0]]
-                        ])
+                        ], dtype=np.int8)
                       ]
 
     print(result_data)
@@ -62,8 +62,8 @@ array_4_step_size = np.repeat(np.arange(3, -1, -1)[np.newaxis, :],
 
 #  List of expected output shapes
 expected_output_shape_list = [
-    [(32, 3), (42, 3), (32,)],
-    [(4, 3), (2, 3), (4,)],
+    [(16, 3), (18, 3), (16,)],
+    [(9, 3), (8, 3), (9,)],
     ]
 
 
@@ -75,3 +75,243 @@ def test_surface_and_sample_factor(step_size, expected_output_shapes):
                                  step_size=step_size)[0][0]
     output_shapes = [out.shape for out in output]
     assert expected_output_shapes == output_shapes
+
+
+@pytest.mark.parametrize("step_size", [1, 3])
+def test_topographic_image_positive_dtype_and_values(step_size):
+    from napari_plot_profile._functions import _topographic_image_positive
+
+    image = np.random.randint(0, 300, (7, 9)).astype(float) + 0.5
+    result = _topographic_image_positive(image, step_size)
+
+    assert result.dtype == np.int16
+    assert result.shape == (int(np.ceil(image.max())) + 1, 7, 9)
+
+    heights = np.full(image.shape, -1)
+    heights[::step_size, ::step_size] = image[::step_size, ::step_size].astype(int)
+    z = np.arange(result.shape[0])[:, np.newaxis, np.newaxis]
+    assert np.array_equal(result, np.where(z <= heights, z, 0))
+
+
+@pytest.mark.parametrize("step_size", [1, 2, 3])
+def test_get_3D_indices(step_size):
+    from napari_plot_profile._functions import _get_3D_indices
+
+    image = np.random.randint(-1000, 1000, (7, 10)) + 0.5
+    z_indices, y_indices, x_indices = _get_3D_indices(image, step_size)
+
+    y, x = np.mgrid[:7:step_size, :10:step_size]
+    assert np.array_equal(y_indices, y.ravel())
+    assert np.array_equal(x_indices, x.ravel())
+    assert np.array_equal(z_indices, image[y, x].astype(int).ravel())
+    assert z_indices.dtype == np.int16
+    assert np.iinfo(y_indices.dtype).max >= 9 and np.iinfo(x_indices.dtype).max >= 9
+
+    points = topographic_points(image, step_size=step_size)[0][0]
+    assert np.array_equal(points, np.stack([-z_indices, y_indices, x_indices], axis=1))
+
+
+def test_topographic_image_lazy():
+    image = np.random.randint(-50, 200, (20, 30))
+
+    eager = topographic_image(image)
+    lazy = topographic_image(image, lazy=True)
+
+    assert len(eager) == len(lazy) == 2
+    for (eager_data, eager_properties, _), (lazy_data, lazy_properties, _) in zip(eager, lazy):
+        assert 'dask' in str(type(lazy_data))
+        assert eager_properties['name'] == lazy_properties['name']
+        assert np.array_equal(eager_data, np.asarray(lazy_data))
+
+
+def test_topographic_z_levels():
+    image = np.asarray([[0, 1000], [2000, 4000.5]])
+
+    data, properties, _ = topographic_image(image, z_levels=8)[0]
+    assert data.shape == (9, 2, 2)
+    assert properties['scale'][0] * (data.shape[0] - 1) == pytest.approx(image.max())
+
+    points = topographic_points(image, z_levels=8)[0][0]
+    assert np.allclose(-points[:, 0], np.floor(image.ravel() / (image.max() / 8)) * image.max() / 8)
+
+    vertices, faces, values = topographic_surface(image, z_levels=8)[0][0]
+    properties = topographic_surface(image, z_levels=8)[0][1]
+    assert -vertices[:, 0].max() <= 8
+    assert properties['scale'][0] == pytest.approx(image.max() / 8)
+
+
+def test_topographic_image_non_integer_maximum():
+    for image, z_levels in [(np.asarray([[0, 1.2], [2.5, 0.7]]), None),
+                            (np.asarray([[0, 1000], [35000, 69987]]), 1000),
+                            (np.asarray([[-3.5, 1000], [0, 69987]]), 1000)]:
+        data, properties, _ = topographic_image(image, z_levels=z_levels)[0]
+        if z_levels:
+            assert data.shape[0] == z_levels + 1
+
+        # the topmost filled z-plane of every pixel is displayed at its height
+        heights = properties['metadata']['topographic_heights']
+        z_scale = properties['scale'][0]
+        top_planes = np.where(heights > 0, np.argmax(np.asarray(data) > 0, axis=0), data.shape[0] - 1)
+        assert np.allclose(properties['translate'][0] + top_planes * z_scale, -heights * z_scale)
+
+
+def test_surface_heights_and_simplification():
+    image = np.zeros((33, 41))
+    image[5:9, 30:35] = np.arange(20).reshape(4, 5)
+
+    vertices, faces, values = topographic_surface(image)[0][0]
+    assert len(vertices) == image.size
+    assert len(faces) == 2 * 32 * 40
+    assert np.array_equal(-vertices[:, 0], image[vertices[:, 1].astype(int), vertices[:, 2].astype(int)])
+
+    simplified_vertices, simplified_faces, simplified_values = topographic_surface(image, max_error=0)[0][0]
+    assert len(simplified_faces) < len(faces) / 2
+    assert np.array_equal(-simplified_vertices[:, 0],
+                          image[simplified_vertices[:, 1].astype(int), simplified_vertices[:, 2].astype(int)])
+
+    # every edge of a closed-border mesh without cracks is shared by two faces, or lies on the image border
+    edges = np.sort(np.concatenate([simplified_faces[:, [0, 1]], simplified_faces[:, [1, 2]],
+                                    simplified_faces[:, [2, 0]]]), axis=1)
+    unique_edges, counts = np.unique(edges, axis=0, return_counts=True)
+    single = simplified_vertices[unique_edges[counts == 1]]
+    on_border = (single[..., 1] == 0) | (single[..., 1] == 32) | (single[..., 2] == 0) | (single[..., 2] == 40)
+    assert np.all(on_border.all(axis=1) & ((single[:, 0, 1] == single[:, 1, 1]) | (single[:, 0, 2] == single[:, 1, 2])))
+
+
+@pytest.mark.parametrize("step_size", [1, 3])
+def test_tiled_topographic_points_and_surface(step_size):
+    import dask.array as da
+
+    image = np.random.randint(0, 100, (45, 37))
+    image[:20, :20] = 0
+    lazy_image = da.from_array(image, chunks=(10, 10))
+
+    points = topographic_points(image, step_size=step_size)[0][0]
+    tiled_points = topographic_points(lazy_image, step_size=step_size, tile_size=7)[0][0]
+    assert np.array_equal(points, tiled_points)
+
+    vertices, faces, values = topographic_surface(image, step_size=step_size)[0][0]
+    tiled_vertices, tiled_faces, tiled_values = topographic_surface(lazy_image, step_size=step_size,
+                                                                    tile_size=16)[0][0]
+    assert np.array_equal(vertices, tiled_vertices)
+    assert np.array_equal(values, tiled_values)
+
+    def triangles(faces):
+        return set(map(tuple, np.sort(faces, axis=1)))
+    assert triangles(faces) == triangles(tiled_faces)
+
+    # simplified tiles keep exact heights
+    tiled_vertices, tiled_faces, _ = topographic_surface(lazy_image, step_size=step_size, max_error=0,
+                                                         tile_size=16)[0][0]
+    assert len(tiled_faces) <= len(faces)
+    assert np.array_equal(-tiled_vertices[:, 0],
+                          image[tiled_vertices[:, 1].astype(int), tiled_vertices[:, 2].astype(int)])
+
+
+@pytest.mark.parametrize("pooling", ['max', 'mean'])
+def test_topographic_points_level_of_detail(pooling):
+    import dask.array as da
+
+    image = np.random.randint(0, 1000, (95, 62))
+
+    points, properties, _ = topographic_points(image, max_points=200, pooling=pooling)[0]
+    assert len(points) <= 200
+    # cells of 6 x 6 pixels
+    assert points.shape == (16 * 11, 3)
+    assert properties['size'] == 6
+
+    padded = np.full((96, 66), np.nan)
+    padded[:95, :62] = image
+    cells = padded.reshape(16, 6, 11, 6)
+    expected = np.nanmax(cells, axis=(1, 3)) if pooling == 'max' else np.nanmean(cells, axis=(1, 3))
+    assert np.array_equal(-points[:, 0], expected.astype(int).ravel())
+    assert np.array_equal(np.unique(points[:, 1]), np.minimum(np.arange(16) * 6 + 2, 94))
+    assert np.array_equal(np.unique(points[:, 2]), np.minimum(np.arange(11) * 6 + 2, 61))
+
+    tiled_points = topographic_points(da.from_array(image, chunks=20), max_points=200, pooling=pooling,
+                                      tile_size=20)[0][0]
+    assert np.array_equal(points, tiled_points)
+
+    # small enough images are not pooled
+    assert np.array_equal(topographic_points(image, max_points=image.size)[0][0], topographic_points(image)[0][0])
+
+    with pytest.raises(ValueError):
+        topographic_points(image, max_points=200, pooling='median')
+
+
+def test_topographic_image_updates_viewer_in_place():
+    from napari.components import ViewerModel
+
+    viewer = ViewerModel()
+    image = np.random.randint(-20, 50, (12, 15))
+    image[0, 0] = 50
+    image[0, 1] = -20
+    first = topographic_image(image, viewer=viewer)
+    assert [layer.name for layer in viewer.layers] == ['topographical image', 'topographical image negative']
+
+    # edit some pixels without changing the value range
+    edited = image.copy()
+    edited[3:5, 4:9] = np.random.randint(-20, 50, (2, 5))
+    edited[7, 7] = -5 if edited[7, 7] > 0 else 5
+    second = topographic_image(edited, viewer=viewer)
+
+    expected = topographic_image(edited)
+    assert len(viewer.layers) == 2
+    for (first_data, _, _), (second_data, _, _), (expected_data, _, _), layer in \
+            zip(first, second, expected, viewer.layers):
+        assert second_data is first_data
+        assert layer.data is first_data
+        assert np.array_equal(layer.data, expected_data)
+
+    # a different value range needs a new volume
+    third = topographic_image(edited * 2, viewer=viewer)
+    assert third[0][0] is not first[0][0]
+    assert viewer.layers['topographical image'].data is third[0][0]
+    assert np.array_equal(third[0][0], topographic_image(edited * 2)[0][0])
+
+
+def test_topographic_points_dtype_limits():
+    from napari_plot_profile._functions import _get_3D_indices
+
+    # heights at the minimum of a type are negated without overflow
+    image = np.asarray([[-128, 0], [127, -1]])
+    z_indices, _, _ = _get_3D_indices(image, 1)
+    assert np.array_equal(-z_indices.astype(int), [128, 0, -127, 1])
+    points = topographic_points(image)[0][0]
+    assert np.array_equal(points[:, 0], [128, 0, -127, 1])
+
+    # tiles of tall images have coordinates beyond the range of types fitting a single tile
+    image = np.random.randint(0, 10, (1000, 50))
+    assert np.array_equal(topographic_points(image, tile_size=8)[0][0], topographic_points(image)[0][0])
+
+    image = np.random.randint(0, 10, (70000, 4))
+    points = topographic_points(image, tile_size=256)[0][0]
+    assert points[:, 1].max() == 69999
+    assert np.array_equal(points, topographic_points(image)[0][0])
+
+
+def test_topographic_image_reuses_volumes_without_modifying_layers():
+    from napari.components import ViewerModel
+    from napari_plot_profile._functions import _topographic_image, _update_layer
+
+    viewer = ViewerModel()
+    image = np.random.randint(-20, 50, (12, 15))
+    image[0, 0] = 50
+    image[0, 1] = -20
+    topographic_image(image, viewer=viewer)
+    volumes = [layer.data.copy() for layer in viewer.layers]
+    heights = [layer.metadata['topographic_heights'].copy() for layer in viewer.layers]
+
+    # the volumes are returned for reuse, but layers are only updated when the results are shown
+    edited = image.copy()
+    edited[3:5, 4:9] = np.random.randint(-20, 50, (2, 5))
+    result = _topographic_image(edited, lazy=True, layers=viewer.layers)
+    for layer, volume, former_heights, (data, _, _) in zip(viewer.layers, volumes, heights, result):
+        assert data is layer.data
+        assert np.array_equal(layer.data, volume)
+        assert np.array_equal(layer.metadata['topographic_heights'], former_heights)
+
+    for layer, (data, properties, _) in zip(viewer.layers, result):
+        _update_layer(layer, data, properties)
+    for layer, (expected, _, _) in zip(viewer.layers, topographic_image(edited)):
+        assert np.array_equal(layer.data, expected)
@@ -0,0 +1,37 @@
+import json
+import subprocess
+import sys
+
+
+def _import_in_subprocess(statement):
+    """Run an import statement in a fresh interpreter; return its duration in seconds and the loaded modules."""
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n" + statement + "\n"
+            "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    duration, modules = json.loads(output.strip().splitlines()[-1])
+    return duration, set(modules)
+
+
+def test_import_does_not_load_gui():
+    heavy_modules = {'qtpy', 'pyqtgraph', 'magicgui', 'napari', 'napari._qt', 'scipy', 'skimage',
+                     'napari_skimage_regionprops', 'vispy'}
+
+    duration, modules = _import_in_subprocess("import napari_plot_profile")
+    assert not heavy_modules & modules
+    assert duration < 2
+
+    _, modules = _import_in_subprocess("from napari_plot_profile import profile, profile_all, kymograph, "
+                                       "topographic_image, topographic_points, topographic_surface")
+    assert not heavy_modules & modules
+
+
+def test_lazy_attributes():
+    import napari_plot_profile
+    from napari_plot_profile import _dock_widget, _profile, _functions
+
+    assert napari_plot_profile.PlotProfile is _dock_widget.PlotProfile
+    assert napari_plot_profile.profile is _profile.profile is _dock_widget.profile
+    assert napari_plot_profile.topographic_surface is _functions.topographic_surface
+    assert napari_plot_profile.napari_experimental_provide_dock_widget() == [_dock_widget.PlotProfile,
+                                                                            _dock_widget.topographical_view]
@@ -0,0 +1,215 @@
+import numpy as np
+
+
+def test_profile():
+    from napari.layers import Image
+    from napari_plot_profile._profile import profile
+
+    image = np.arange(100).reshape(10, 10)
+    layer = Image(image)
+
+    result = profile(layer, np.asarray([[0, 0], [0, 9], [9, 9]]), num_points=19)
+
+    assert len(result['positions']) == 19
+    assert np.allclose(result['distances'], np.arange(19))
+    assert np.array_equal(result['intensities'], list(range(10)) + list(range(19, 100, 10)))
+
+    # points outside the image are skipped
+    result = profile(layer, np.asarray([[0, -4], [0, 4]]), num_points=9)
+    assert np.array_equal(result['intensities'], [0, 1, 2, 3, 4])
+    assert np.allclose(result['distances'], [4, 5, 6, 7, 8])
+
+
+def test_profile_chunked():
+    import dask.array as da
+    from napari.layers import Image
+    from napari_plot_profile._profile import profile
+
+    image = np.random.random((100, 100))
+    line = np.asarray([[5, 5], [90, 20], [40, 95]])
+
+    reference = profile(Image(image), line, num_points=300)
+    result = profile(Image(da.from_array(image, chunks=(10, 10))), line, num_points=300)
+    assert np.array_equal(reference['intensities'], result['intensities'])
+
+    class RecordingArray:
+        """zarr-like array which records which regions were read"""
+        def __init__(self, data, chunks):
+            self._data = data
+            self.shape = data.shape
+            self.dtype = data.dtype
+            self.ndim = data.ndim
+            self.chunks = chunks
+            self.reads = []
+
+        def __getitem__(self, key):
+            self.reads.append(key)
+            return self._data[key]
+
+    from napari_plot_profile._profile import _gather
+    recording = RecordingArray(image, (10, 10))
+    assert np.array_equal(_gather(recording, reference['positions']), reference['intensities'])
+    for key in recording.reads:
+        # every read stays within a single chunk
+        assert all(k.start // 10 == (k.stop - 1) // 10 for k in key)
+
+    # interpolated reads load windows around the chunks the line crosses, not the bounding box of the line
+    from napari_plot_profile._profile import kymograph
+    image = np.random.random((2000, 2000))
+    line = np.asarray([[10, 10], [1990, 1985]])
+    for interpolation, margin in [('linear', 1), ('cubic', 12)]:
+        reference = profile(Image(image), line, num_points=500, interpolation=interpolation)
+        recording = RecordingArray(image, (100, 100))
+        layer = Image(recording, contrast_limits=(0, 1))
+        recording.reads = []
+        result = profile(layer, line, num_points=500, interpolation=interpolation)
+        assert np.allclose(reference['intensities'], result['intensities'], atol=1e-6)
+        read_pixels = sum((k[0].stop - k[0].start) * (k[1].stop - k[1].start) for k in recording.reads)
+        assert read_pixels < 25 * (100 + 2 * margin + 1) ** 2
+
+    timelapse = np.random.random((3, 500, 500))
+    recording = RecordingArray(timelapse, (1, 100, 100))
+    layer = Image(recording, contrast_limits=(0, 1))
+    recording.reads = []
+    result = kymograph(layer, np.asarray([[0, 5, 5], [0, 490, 480]]), num_points=200,
+                       interpolation='linear')
+    reference = kymograph(Image(timelapse), np.asarray([[0, 5, 5], [0, 490, 480]]), num_points=200,
+                          interpolation='linear')
+    assert np.allclose(result['intensities'], reference['intensities'])
+    read_pixels = sum(np.prod([k.stop - k.start for k in key]) for key in recording.reads)
+    # the bounding box of the line would be about 3 * 485 * 475 pixels
+    assert read_pixels < 3 * 500 * 500 / 2
+
+
+def test_profile_multiscale():
+    from napari.layers import Image
+    from napari_plot_profile._profile import profile
+
+    image = np.arange(64 * 64).reshape(64, 64)
+    layer = Image([image, image[::2, ::2], image[::4, ::4]], multiscale=True)
+    line = np.asarray([[0, 0], [0, 63]])
+
+    # few samples: coarsest level
+    result = profile(layer, line, num_points=9)
+    assert np.array_equal(result['intensities'], image[0, ::4][result['positions'][:, 1] // 4])
+
+    # one sample per pixel: full resolution
+    result = profile(layer, line, num_points=64)
+    assert np.array_equal(result['intensities'], image[0])
+
+    result = profile(layer, line, num_points=9, full_resolution=True)
+    assert np.array_equal(result['intensities'], image[tuple(result['positions'].T)])
+
+
+def test_profile_linewidth():
+    from napari.layers import Image
+    from napari_plot_profile._profile import profile
+
+    # rows have increasing intensity; a horizontal band of 5 rows averages row 3..7
+    image = np.repeat(np.arange(30)[:, np.newaxis], 20, axis=1).astype(float)
+    layer = Image(image)
+    line = np.asarray([[5, 2], [5, 17]])
+
+    result = profile(layer, line, num_points=16, linewidth=5)
+    assert np.allclose(result['intensities'], 5)
+    result = profile(layer, line, num_points=16, linewidth=5, reduce_func='max')
+    assert np.allclose(result['intensities'], 7)
+
+    # band points outside the image are ignored
+    line = np.asarray([[0, 2], [0, 17]])
+    result = profile(layer, line, num_points=16, linewidth=5, reduce_func='median')
+    assert np.allclose(result['intensities'], 1)
+
+    # linear interpolation between rows
+    line = np.asarray([[12.7, 2], [12.7, 17]])
+    for interpolation, expected in [('truncate', 12), ('nearest', 13), ('linear', 12.7), ('cubic', 12.7)]:
+        result = profile(layer, line, num_points=16, interpolation=interpolation)
+        assert np.allclose(result['intensities'], expected)
+
+
+def test_profile_interpolation_outside_and_prefilter_cache():
+    from napari.layers import Image
+    from napari_plot_profile._profile import profile
+
+    image = np.random.random((40, 50))
+    layer = Image(image)
+    line = np.asarray([[-5.5, 10.2], [20.3, 30.7], [45.1, 35.9]])
+
+    for interpolation in ['truncate', 'nearest', 'linear', 'cubic']:
+        dropped = profile(layer, line, num_points=50, interpolation=interpolation)
+        kept = profile(layer, line, num_points=50, interpolation=interpolation, keep_outside=True)
+
+        # samples outside the image are NaN and the profile keeps its length
+        assert len(kept['intensities']) == len(kept['distances']) == len(kept['positions']) == 50
+        inside = ~np.isnan(kept['intensities'])
+        assert 0 < inside.sum() < 50
+        assert np.array_equal(kept['intensities'][inside], dropped['intensities'])
+        assert np.array_equal(kept['distances'][inside], dropped['distances'])
+
+    # spline coefficients are computed once and give the same result as without cache
+    prefilter_cache = {}
+    reference = profile(layer, line, num_points=50, interpolation='cubic')
+    cached = profile(layer, line, num_points=50, interpolation='cubic', prefilter_cache=prefilter_cache)
+    assert np.allclose(cached['intensities'], reference['intensities'])
+    assert len(prefilter_cache) == 1
+    coefficients = next(iter(prefilter_cache.values()))[1]
+
+    cached = profile(layer, line[::-1], num_points=50, interpolation='cubic', prefilter_cache=prefilter_cache)
+    assert np.allclose(cached['intensities'], profile(layer, line[::-1], num_points=50,
+                                                      interpolation='cubic')['intensities'])
+    assert next(iter(prefilter_cache.values()))[1] is coefficients
+
+    # in a stack, only the plane of the line is prefiltered
+    stack = np.random.random((6, 50, 60))
+    prefilter_cache = {}
+    for z in [2, 4]:
+        stack_line = np.concatenate([np.full((len(line), 1), z), line], axis=1)
+        cached = profile(Image(stack), stack_line, num_points=50, interpolation='cubic', linewidth=3,
+                         prefilter_cache=prefilter_cache)
+        reference = profile(Image(stack[z]), line, num_points=50, interpolation='cubic', linewidth=3)
+        assert np.allclose(cached['intensities'], reference['intensities'])
+        for interpolation in ['linear', 'cubic']:
+            uncached = profile(Image(stack), stack_line, num_points=50, interpolation=interpolation)
+            assert np.allclose(uncached['intensities'],
+                               profile(Image(stack[z]), line, num_points=50, interpolation=interpolation)['intensities'])
+    assert [entry[1].ndim for entry in prefilter_cache.values()] == [2, 2]
+
+
+def test_kymograph():
+    import dask.array as da
+    from napari.layers import Image
+    from napari_plot_profile._profile import kymograph, profile
+
+    timelapse = np.random.random((5, 50, 60))
+    line = np.asarray([[0, 5, 5], [0, 40, 50]])
+
+    for data in [timelapse, da.from_array(timelapse, chunks=(1, 20, 20))]:
+        result = kymograph(Image(data), line, axis=0, num_points=30)
+        assert result['intensities'].shape == (5, 30)
+        for t in range(5):
+            reference = profile(Image(timelapse[t]), line[:, 1:], num_points=30)
+            assert np.array_equal(result['intensities'][t], reference['intensities'])
+
+
+def test_profile_all():
+    from napari.layers import Image, Shapes
+    from napari_plot_profile._profile import profile, profile_all
+
+    image1 = Image(np.random.random((100, 100)), name='image1')
+    image2 = Image(np.random.random((100, 100)), name='image2')
+    lines = [np.asarray([[10, 10], [50, 80]]),
+             np.asarray([[90, 5], [20, 20], [20, 20], [60, 95]]),
+             np.asarray([[30, 30], [30, 30]])]
+    shapes = Shapes(lines + [np.asarray([[0, 0], [10, 0], [10, 10], [0, 10]])],
+                    shape_type=['line', 'path', 'path', 'rectangle'])
+
+    table = profile_all(shapes, [image1, image2], num_points=50)
+
+    assert set(table['shape_index']) == {0, 1, 2}
+    for layer in [image1, image2]:
+        for index, line in enumerate(lines):
+            reference = profile(layer, line, num_points=50)
+            rows = (table['layer'] == layer.name) & (table['shape_index'] == index)
+            assert np.array_equal(table['intensity'][rows], reference['intensities'])
+            assert np.allclose(table['distance'][rows], reference['distances'])
+            assert np.array_equal(table['pos1'][rows], reference['positions'][:, 1])